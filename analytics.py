@@ -0,0 +1,517 @@
+import hashlib
+import heapq
+import math
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+from data_processor import DEFAULT_CHUNK_SIZE, shard_chunks, split_shards
+
+# Number of products listed per location
+DEFAULT_TOP_K = 5
+
+# HyperLogLog registers are 2 ** precision bytes; relative standard error is 1.04 / sqrt(2 ** precision)
+DEFAULT_HLL_PRECISION = 12
+
+# Count-Min sketch: estimates exceed the true value by at most epsilon * total with probability 1 - delta
+DEFAULT_CM_EPSILON = 0.001
+DEFAULT_CM_DELTA = 0.01
+
+# Products tracked by Space-Saving, each estimate is at most total / capacity above the true value
+DEFAULT_SPACE_SAVING_CAPACITY = 1024
+
+# Customers kept in the hash sample behind the repeat-customer rate
+DEFAULT_SAMPLE_SIZE = 4096
+
+
+def hash64(value):
+    """
+    Hashes a value to 64 bits. Unlike hash(), the result is the same in every process,
+    so sketches built by different workers can be merged.
+
+    :param value: string to hash
+    :return: integer between 0 and 2 ** 64 - 1
+    """
+    return int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+# Estimates the number of distinct values in a fixed amount of memory
+class HyperLogLog:
+
+    def __init__(self, precision=DEFAULT_HLL_PRECISION):
+        """
+        :param precision: number of hash bits that choose the register, between 4 and 16.
+                          Memory is 2 ** precision bytes and the relative standard error is
+                          1.04 / sqrt(2 ** precision), e.g. 1.6% for the default of 12
+        """
+        if not 4 <= precision <= 16:
+            raise ValueError("HyperLogLog precision must be between 4 and 16")
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    @property
+    def relative_error(self):
+        return 1.04 / math.sqrt(len(self.registers))
+
+    def add(self, value):
+        self.add_hash(hash64(value))
+
+    def add_hash(self, hashed):
+        """
+        Adds a value by its 64-bit hash.
+
+        :param hashed: result of hash64
+        :return: None
+        """
+        bits = 64 - self.precision
+        index = hashed >> bits
+        # Position of the first 1 bit in the rest of the hash
+        rank = bits - (hashed & ((1 << bits) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        """
+        Combines two sketches, the result counts the values added to either of them.
+
+        :param other: HyperLogLog with the same precision
+        :return: None
+        """
+        if other.precision != self.precision:
+            raise ValueError("Only HyperLogLog sketches with the same precision can be merged")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def count(self):
+        """
+        :return: estimated number of distinct values
+        """
+        size = len(self.registers)
+        alpha = {16: 0.673, 32: 0.697, 64: 0.709}.get(size, 0.7213 / (1 + 1.079 / size))
+        estimate = alpha * size * size / sum(2.0 ** -rank for rank in self.registers)
+        # Small cardinalities are counted more precisely from the number of empty registers
+        empty = self.registers.count(0)
+        if estimate <= 2.5 * size and empty:
+            estimate = size * math.log(size / empty)
+        return round(estimate)
+
+
+# Estimates the total amount per key, never below the true total
+class CountMinSketch:
+
+    def __init__(self, epsilon=DEFAULT_CM_EPSILON, delta=DEFAULT_CM_DELTA):
+        """
+        For non-negative amounts every estimate is at least the true total, and with probability
+        1 - delta at most epsilon * (sum of all amounts) above it.
+
+        :param epsilon: error as a share of the sum of all amounts, sets the width to ceil(e / epsilon)
+        :param delta: probability of a larger error, sets the depth to ceil(ln(1 / delta))
+        """
+        self.width = math.ceil(math.e / epsilon)
+        self.depth = math.ceil(math.log(1 / delta))
+        self.rows = [array('d', bytes(8 * self.width)) for _ in range(self.depth)]
+        self.total = 0.0
+
+    def _slots(self, hashed):
+        # Double hashing: the two halves of one 64-bit hash give a different slot in every row
+        first, second = hashed >> 32, hashed & 0xFFFFFFFF
+        return [(first + row * second) % self.width for row in range(self.depth)]
+
+    def add(self, key, amount=1.0):
+        self.add_hash(hash64(key), amount)
+
+    def add_hash(self, hashed, amount=1.0):
+        for row, slot in zip(self.rows, self._slots(hashed)):
+            row[slot] += amount
+        self.total += amount
+
+    def estimate(self, key):
+        """
+        :param key: the key to look up
+        :return: estimated total amount added for the key
+        """
+        return min(row[slot] for row, slot in zip(self.rows, self._slots(hash64(key))))
+
+    def merge(self, other):
+        """
+        Adds the counters of another sketch, as if its amounts had been added to this one.
+
+        :param other: CountMinSketch with the same width and depth
+        :return: None
+        """
+        if (other.width, other.depth) != (self.width, self.depth):
+            raise ValueError("Only Count-Min sketches of the same size can be merged")
+        for row, other_row in zip(self.rows, other.rows):
+            for slot, amount in enumerate(other_row):
+                if amount:
+                    row[slot] += amount
+        self.total += other.total
+
+
+# Keeps the keys with the largest totals in a fixed number of counters
+class SpaceSaving:
+
+    def __init__(self, capacity=DEFAULT_SPACE_SAVING_CAPACITY):
+        """
+        Each counter overestimates its key's total by at most its recorded error, which is at most
+        (sum of all amounts) / capacity. Every key whose true total is above that is guaranteed to be kept.
+
+        :param capacity: number of keys tracked
+        """
+        self.capacity = capacity
+        self.counters = {}  # key -> [estimated total, maximum overestimate]
+        self.total = 0.0
+        self._heap = []  # (estimated total, key), may hold outdated entries, used to find the smallest counter
+
+    def add(self, key, amount=1.0):
+        """
+        Adds an amount to a key, replacing the smallest counter if the key isn't tracked and all counters are used.
+
+        :param key: the key, e.g. a ProductID
+        :param amount: non-negative amount, e.g. the revenue of a transaction
+        :return: None
+        """
+        self.total += amount
+        counter = self.counters.get(key)
+        if counter is not None:
+            counter[0] += amount
+        elif len(self.counters) < self.capacity:
+            counter = self.counters[key] = [amount, 0.0]
+        else:
+            smallest, evicted = self._pop_smallest()
+            del self.counters[evicted]
+            counter = self.counters[key] = [smallest + amount, smallest]
+        heapq.heappush(self._heap, (counter[0], key))
+        if len(self._heap) > 4 * self.capacity:
+            self._heap = [(counter[0], key) for key, counter in self.counters.items()]
+            heapq.heapify(self._heap)
+
+    def _pop_smallest(self):
+        # Skip heap entries whose counter has grown or was evicted since they were pushed
+        while True:
+            estimate, key = heapq.heappop(self._heap)
+            counter = self.counters.get(key)
+            if counter is not None and counter[0] == estimate:
+                return estimate, key
+
+    def _floor(self):
+        # Largest total an untracked key can have
+        if len(self.counters) < self.capacity:
+            return 0.0
+        return min(counter[0] for counter in self.counters.values())
+
+    def merge(self, other):
+        """
+        Combines two summaries. A key missing from one summary is assumed to have the smallest total
+        that summary could have dropped, which keeps the error within (sum of all amounts) / capacity.
+
+        :param other: SpaceSaving summary of other data
+        :return: None
+        """
+        floor, other_floor = self._floor(), other._floor()
+        merged = {}
+        for key in set(self.counters) | set(other.counters):
+            mine = self.counters.get(key, [floor, floor])
+            theirs = other.counters.get(key, [other_floor, other_floor])
+            merged[key] = [mine[0] + theirs[0], mine[1] + theirs[1]]
+        kept = heapq.nlargest(self.capacity, merged.items(), key=lambda item: item[1][0])
+        self.counters = dict(kept)
+        self.total += other.total
+        self._heap = [(counter[0], key) for key, counter in self.counters.items()]
+        heapq.heapify(self._heap)
+
+    def top(self, k):
+        """
+        :param k: number of keys wanted
+        :return: list of (key, estimated total, maximum overestimate), largest total first
+        """
+        return [(key, counter[0], counter[1])
+                for key, counter in heapq.nlargest(k, self.counters.items(), key=lambda item: item[1][0])]
+
+
+# Counts the transactions of a hash-chosen sample of customers, for shares such as the repeat-customer rate
+class CustomerSample:
+
+    def __init__(self, capacity=DEFAULT_SAMPLE_SIZE):
+        """
+        A customer is in the sample when the first `level` bits of its hash are 0, so every transaction
+        of a sampled customer is counted, in any shard. When the sample grows beyond the capacity
+        the level goes up and about half of the customers are dropped.
+        The standard error of a share p measured on the sample is sqrt(p * (1 - p) / n) for n sampled
+        customers, and n stays between capacity / 2 and capacity once sampling has started.
+
+        :param capacity: maximum number of customers kept
+        """
+        self.capacity = capacity
+        self.level = 0
+        self.customers = {}  # customer -> [transactions, hash]
+
+    def add_hash(self, customer, hashed):
+        if self.level and hashed >> (64 - self.level):
+            return
+        entry = self.customers.get(customer)
+        if entry is None:
+            self.customers[customer] = [1, hashed]
+            self._shrink()
+        else:
+            entry[0] += 1
+
+    def _shrink(self):
+        while len(self.customers) > self.capacity:
+            self.level += 1
+            self.customers = {customer: entry for customer, entry in self.customers.items()
+                              if not entry[1] >> (64 - self.level)}
+
+    def merge(self, other):
+        """
+        Combines two samples taken with the same capacity.
+
+        :param other: CustomerSample of other data
+        :return: None
+        """
+        self.level = max(self.level, other.level)
+        customers = {}
+        for sample in (self, other):
+            for customer, (transactions, hashed) in sample.customers.items():
+                if self.level and hashed >> (64 - self.level):
+                    continue
+                entry = customers.get(customer)
+                if entry is None:
+                    customers[customer] = [transactions, hashed]
+                else:
+                    entry[0] += transactions
+        self.customers = customers
+        self._shrink()
+
+    def repeat_rate(self):
+        """
+        :return: share of the sampled customers with more than one transaction, 0.0 if there are none
+        """
+        if not self.customers:
+            return 0.0
+        return sum(1 for transactions, _ in self.customers.values() if transactions > 1) / len(self.customers)
+
+
+# Exact customer and product figures for one store location, memory grows with the number of distinct values
+class ExactStats:
+
+    def __init__(self):
+        self.revenue = {}  # product -> revenue
+        self.visits = {}  # customer -> number of transactions
+
+    def add(self, customer, product, revenue):
+        """
+        :param customer: CustomerID, or '' if missing
+        :param product: ProductID, or '' if missing
+        :param revenue: total price of the transaction, or None if it wasn't a valid number
+        :return: None
+        """
+        if customer:
+            self.visits[customer] = self.visits.get(customer, 0) + 1
+        if product and revenue is not None:
+            self.revenue[product] = self.revenue.get(product, 0.0) + revenue
+
+    def merge(self, other):
+        for customer, visits in other.visits.items():
+            self.visits[customer] = self.visits.get(customer, 0) + visits
+        for product, revenue in other.revenue.items():
+            self.revenue[product] = self.revenue.get(product, 0.0) + revenue
+
+    def distinct_customers(self):
+        return len(self.visits)
+
+    def repeat_customer_rate(self):
+        if not self.visits:
+            return 0.0
+        return sum(1 for visits in self.visits.values() if visits > 1) / len(self.visits)
+
+    def top_products(self, k=DEFAULT_TOP_K):
+        """
+        :param k: number of products wanted
+        :return: list of (product, revenue), highest revenue first
+        """
+        return heapq.nlargest(k, self.revenue.items(), key=lambda item: item[1])
+
+    def product_revenue(self, product):
+        return self.revenue.get(product, 0.0)
+
+
+# Approximate customer and product figures for one store location in a fixed amount of memory
+class SketchStats:
+
+    def __init__(self, precision=DEFAULT_HLL_PRECISION, capacity=DEFAULT_SPACE_SAVING_CAPACITY,
+                 epsilon=DEFAULT_CM_EPSILON, delta=DEFAULT_CM_DELTA, sample_size=DEFAULT_SAMPLE_SIZE):
+        """
+        :param precision: HyperLogLog precision for the distinct customers
+        :param capacity: number of products tracked by Space-Saving for the top products
+        :param epsilon: Count-Min error share for the revenue of any single product
+        :param delta: Count-Min failure probability
+        :param sample_size: number of customers sampled for the repeat-customer rate
+        """
+        self.customers = HyperLogLog(precision)
+        self.heavy_hitters = SpaceSaving(capacity)
+        self.revenue = CountMinSketch(epsilon, delta)
+        self.sample = CustomerSample(sample_size)
+
+    def add(self, customer, product, revenue):
+        """
+        :param customer: CustomerID, or '' if missing
+        :param product: ProductID, or '' if missing
+        :param revenue: total price of the transaction, or None if it wasn't a valid number
+        :return: None
+        """
+        if customer:
+            hashed = hash64(customer)
+            self.customers.add_hash(hashed)
+            self.sample.add_hash(customer, hashed)
+        if product and revenue is not None:
+            self.heavy_hitters.add(product, revenue)
+            self.revenue.add(product, revenue)
+
+    def merge(self, other):
+        self.customers.merge(other.customers)
+        self.heavy_hitters.merge(other.heavy_hitters)
+        self.revenue.merge(other.revenue)
+        self.sample.merge(other.sample)
+
+    def distinct_customers(self):
+        return self.customers.count()
+
+    def repeat_customer_rate(self):
+        return self.sample.repeat_rate()
+
+    def top_products(self, k=DEFAULT_TOP_K):
+        """
+        Lists the products with the highest estimated revenue. The Space-Saving estimate is capped
+        by the Count-Min one, since both only ever overestimate.
+
+        :param k: number of products wanted
+        :return: list of (product, estimated revenue), highest revenue first
+        """
+        top = [(product, min(estimate, self.revenue.estimate(product)))
+               for product, estimate, _ in self.heavy_hitters.top(k)]
+        return sorted(top, key=lambda item: item[1], reverse=True)
+
+    def product_revenue(self, product):
+        return self.revenue.estimate(product)
+
+    def error_bounds(self):
+        """
+        :return: dictionary with the guaranteed or expected error of each figure
+        """
+        sampled = len(self.sample.customers)
+        return {
+            "Distinct Customers": f"±{self.customers.relative_error:.1%} (one standard error)",
+            "Top Products by Revenue": f"at most {self.heavy_hitters.total / self.heavy_hitters.capacity:.2f} "
+                                       f"above the true revenue",
+            "Product Revenue": f"at most {self.revenue.total * math.e / self.revenue.width:.2f} above the true "
+                               f"revenue with probability {1 - math.exp(-self.revenue.depth):.0%}",
+            "Repeat Customer Rate": f"±{0.5 / math.sqrt(sampled):.1%} at most (one standard error)"
+                                    if self.sample.level else "exact, every customer is in the sample",
+        }
+
+
+def update_stats(groups, store, factory):
+    """
+    Adds the transactions of a ColumnStore to the per-location figures.
+
+    :param groups: dictionary of store location -> ExactStats or SketchStats, updated in place
+    :param store: ColumnStore with StoreLocation, CustomerID, ProductID and TotalPrice columns
+    :param factory: function without arguments that creates the figures of a new location
+    :return: None
+    """
+    if not all(name in store for name in ('StoreLocation', 'CustomerID', 'ProductID', 'TotalPrice')):
+        return
+    names = store.categories['StoreLocation']
+    locations = store.columns['StoreLocation']
+    customers = store.columns['CustomerID']
+    products = store.columns['ProductID']
+    prices = store.columns['TotalPrice']
+    mask = store.nulls['TotalPrice'] if store.null_counts['TotalPrice'] else None
+    for position in range(len(store)):
+        location = names[locations[position]]
+        stats = groups.get(location)
+        if stats is None:
+            stats = groups[location] = factory()
+        stats.add(customers[position], products[position],
+                  None if mask is not None and mask[position] else prices[position])
+
+
+def _factory(exact, options):
+    if exact:
+        return ExactStats
+    return lambda: SketchStats(**options)
+
+
+def analyze_shard(file_path, begin, end, chunk_size=DEFAULT_CHUNK_SIZE, exact=False, options=None):
+    """
+    Computes the per-location figures of one byte range of a csv file. Runs inside a worker process.
+
+    :param file_path: path to the csv file
+    :param begin: byte offset of the first line of the range
+    :param end: byte offset just after the last line of the range
+    :param chunk_size: number of rows parsed at a time
+    :param exact: if True, count exactly instead of using sketches
+    :param options: keyword arguments for SketchStats
+    :return: dictionary of store location -> ExactStats or SketchStats
+    """
+    groups = {}
+    factory = _factory(exact, options or {})
+    for chunk in shard_chunks(file_path, begin, end, chunk_size):
+        update_stats(groups, chunk, factory)
+    return groups
+
+
+def customer_product_stats(processor, exact=None, **options):
+    """
+    Computes distinct customers, repeat-customer rate and product revenue for every store location.
+    Loaded data is counted exactly by default; streamed data uses sketches, read in parallel by the
+    processor's workers, so that memory stays bounded however many customers and products there are.
+
+    :param processor: DataProcessor with the data loaded or streamed
+    :param exact: True for exact counts, False for sketches, None to choose by the processor's mode
+    :param options: keyword arguments for SketchStats, e.g. precision or capacity
+    :return: dictionary of store location -> ExactStats or SketchStats
+    """
+    if exact is None:
+        exact = not processor.streaming
+    groups = {}
+    if processor.streaming and processor.workers > 1:
+        # Every worker sketches one shard of the file, the sketches are merged afterwards
+        shards = split_shards(processor.file_path, processor.workers)
+        with ProcessPoolExecutor(max_workers=processor.workers) as pool:
+            for partial in pool.map(analyze_shard, [processor.file_path] * len(shards),
+                                    [begin for begin, _ in shards], [end for _, end in shards],
+                                    [processor.chunk_size] * len(shards), [exact] * len(shards),
+                                    [options] * len(shards)):
+                for location, stats in partial.items():
+                    if location in groups:
+                        groups[location].merge(stats)
+                    else:
+                        groups[location] = stats
+        return groups
+
+    factory = _factory(exact, options)
+    for store in processor._stores():
+        update_stats(groups, store, factory)
+    return groups
+
+
+def customer_report(processor, k=DEFAULT_TOP_K, exact=None, **options):
+    """
+    Summarises the customers and best-selling products of every store location.
+
+    :param processor: DataProcessor with the data loaded or streamed
+    :param k: number of top products per location
+    :param exact: True for exact counts, False for sketches, None to choose by the processor's mode
+    :param options: keyword arguments for SketchStats
+    :return: dictionary of store location -> distinct customers, repeat-customer rate and top products
+    """
+    report = {}
+    for location, stats in customer_product_stats(processor, exact, **options).items():
+        report[location] = {
+            "Distinct Customers": stats.distinct_customers(),
+            "Repeat Customer Rate": f"{stats.repeat_customer_rate() * 100:.2f}%",
+            "Top Products by Revenue": {product: round(revenue, 2) for product, revenue in stats.top_products(k)},
+        }
+        if isinstance(stats, SketchStats):
+            report[location]["Error Bounds"] = stats.error_bounds()
+    return report
@@ -0,0 +1,6 @@
+"""
+Benchmarks for DataProcessor. Run them from the project folder, for example:
+
+    python -m benchmarks.suite --rows 1000 100000 --output results.json
+    python -m benchmarks.generator transactions.csv --rows 1000000
+"""
@@ -0,0 +1,36 @@
+"""
+Compares parsing a csv file with loading the same data from the binary cache.
+
+Run from the project folder:  python -m benchmarks.bench_cache [rows]
+"""
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.generator import write_csv
+from data_processor import DataProcessor
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 10 ** 6
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, 'transactions.csv')
+        write_csv(path, rows)
+        print(f"rows: {rows}, file size: {os.path.getsize(path) / (1024 * 1024):.1f} MB")
+
+        start = time.perf_counter()
+        DataProcessor(path, cache=True)
+        print(f"parse and write cache: {time.perf_counter() - start:8.3f} s")
+
+        start = time.perf_counter()
+        processor = DataProcessor(path, cache=True)
+        print(f"load from cache:       {time.perf_counter() - start:8.3f} s")
+
+        start = time.perf_counter()
+        processor.group_by_location()
+        print(f"group_by_location:     {time.perf_counter() - start:8.3f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""
+Measures the cost of one histogram animation frame for growing numbers of values.
+The time per frame should stay the same, because a frame only changes the heights of the bars.
+
+Run from the project folder:  python -m benchmarks.bench_histogram [largest row count]
+"""
+import random
+import sys
+import time
+from array import array
+
+from visualizer import build_histogram_animation, histogram_bins
+
+
+def main():
+    largest = int(sys.argv[1]) if len(sys.argv) > 1 else 10 ** 7
+    rng = random.Random(42)
+    rows = 500
+    while rows <= largest:
+        values = array('d', (rng.uniform(1, 5000) for _ in range(rows)))
+
+        start = time.perf_counter()
+        counts, edges = histogram_bins(values)
+        bins_ms = (time.perf_counter() - start) * 1000
+
+        fig, update, frames = build_histogram_animation(counts, edges, "Benchmark")
+        fig.canvas.draw()
+        start = time.perf_counter()
+        for frame in range(frames):
+            update(frame)
+            fig.canvas.draw()
+        frame_ms = (time.perf_counter() - start) / frames * 1000
+
+        print(f"rows {rows:>10}: binning {bins_ms:9.2f} ms   per frame {frame_ms:7.2f} ms")
+        rows *= 10
+
+
+if __name__ == "__main__":
+    main()
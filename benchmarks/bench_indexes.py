@@ -0,0 +1,76 @@
+"""
+Compares the hash-indexed lookups of DataProcessor with a plain linear scan.
+
+Run from the project folder:  python -m benchmarks.bench_indexes [rows]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+from benchmarks.generator import write_csv
+from data_processor import DataProcessor
+
+
+def build_processor(rows):
+    """
+    Writes synthetic transactions to a temporary csv file and loads them into a DataProcessor.
+
+    :param rows: number of transactions to generate
+    :return: the DataProcessor
+    """
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, 'transactions.csv')
+        write_csv(path, rows)
+        return DataProcessor(path)
+
+
+def timed(function, repeat):
+    """
+    Calls a function several times and returns the mean time per call in milliseconds.
+    """
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 10 ** 6
+    processor = build_processor(rows)
+    store = processor.store
+    ids = [str(random.randint(1, rows)) for _ in range(20)]
+
+    # Linear scans, the way the lookups worked before the indexes
+    def scan_id():
+        for key in ids:
+            next((p for p, value in enumerate(store.columns['TransactionID']) if value == key), None)
+
+    def scan_location():
+        code = store.code_of('StoreLocation', 'Rural')
+        [p for p, stored in enumerate(store.columns['StoreLocation']) if stored == code]
+
+    # Indexed lookups, the first call also pays for building the index
+    build_start = time.perf_counter()
+    processor.get_transaction_details('1')
+    processor._positions_where('StoreLocation', 'Rural')
+    build_ms = (time.perf_counter() - build_start) * 1000
+
+    def indexed_id():
+        for key in ids:
+            processor.get_transaction_details(key)
+
+    def indexed_location():
+        processor._positions_where('StoreLocation', 'Rural')
+
+    print(f"rows: {rows}")
+    print(f"index build:           {build_ms:10.2f} ms")
+    print(f"TransactionID scan:    {timed(scan_id, 1) / len(ids):10.4f} ms per lookup")
+    print(f"TransactionID index:   {timed(indexed_id, 10) / len(ids):10.4f} ms per lookup")
+    print(f"StoreLocation scan:    {timed(scan_location, 3):10.2f} ms per lookup")
+    print(f"StoreLocation index:   {timed(indexed_location, 10):10.4f} ms per lookup")
+
+
+if __name__ == "__main__":
+    main()
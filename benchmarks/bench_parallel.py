@@ -0,0 +1,37 @@
+"""
+Measures how streaming aggregation scales with the number of worker processes.
+
+Run from the project folder:  python -m benchmarks.bench_parallel [rows] [worker counts...]
+"""
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.generator import write_csv
+from data_processor import DataProcessor
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 10 ** 6
+    worker_counts = [int(count) for count in sys.argv[2:]] or [1, 2, 4, 8]
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, 'transactions.csv')
+        write_csv(path, rows)
+        print(f"rows: {rows}, cpus: {os.cpu_count()}")
+        baseline = None
+        expected = None
+        for workers in worker_counts:
+            start = time.perf_counter()
+            processor = DataProcessor(path, streaming=True, workers=workers)
+            result = (processor.group_by_location(), processor.sales_summaries())
+            elapsed = time.perf_counter() - start
+            baseline = baseline or elapsed
+            expected = expected or result
+            # The merged shard totals have to give the same answers as the serial run
+            same = "same" if result == expected else "DIFFERENT"
+            print(f"workers {workers:2}: {elapsed:8.2f} s   speed-up {baseline / elapsed:5.2f}x   results {same}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""
+Measures TotalPrice parsing throughput: the old per-row string munging against the batched parse_numbers.
+
+Run from the project folder:  python -m benchmarks.bench_parsing [rows]
+"""
+import random
+import sys
+import time
+
+from data_processor import DEFAULT_CHUNK_SIZE, parse_numbers
+
+
+def parse_per_row(values):
+    # The way group_by_location used to parse every TotalPrice value on every call
+    result = []
+    for value in values:
+        text = value.strip()
+        result.append(float(text.replace(',', '.')) if text.replace(',', '').replace('.', '', 1).isdigit() else 0.0)
+    return result
+
+
+def parse_batched(values):
+    for begin in range(0, len(values), DEFAULT_CHUNK_SIZE):
+        parse_numbers(values[begin:begin + DEFAULT_CHUNK_SIZE])
+
+
+def rows_per_second(function, values):
+    start = time.perf_counter()
+    function(values)
+    return len(values) / (time.perf_counter() - start)
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 10 ** 6
+    rng = random.Random(42)
+    clean = [f"{rng.uniform(1, 5000):.2f}" for _ in range(rows)]
+    # One value in a thousand written with a currency symbol and thousands separator
+    messy = [f"£{float(value):,.2f}" if i % 1000 == 0 else value for i, value in enumerate(clean)]
+    print(f"rows: {rows}")
+    for label, values in (("plain numbers", clean), ("0.1% formatted", messy)):
+        print(f"{label:15} per row: {rows_per_second(parse_per_row, values):12,.0f} rows/s   "
+              f"batched: {rows_per_second(parse_batched, values):12,.0f} rows/s")
+
+
+if __name__ == "__main__":
+    main()
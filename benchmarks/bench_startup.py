@@ -0,0 +1,79 @@
+"""
+Measures how long the text menu takes to start: the import time of main.py, broken down with
+python -X importtime, and the wall time from starting main.py until the first menu is printed.
+The plotting stack (matplotlib, numpy, tkinter) should not show up, it is only loaded for options 8 and 9.
+
+Run from the project folder:  python -m benchmarks.bench_startup [csv file] [repeats]
+"""
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Modules that should only be imported when a chart or the dashboard is opened
+LAZY_MODULES = ('matplotlib', 'numpy', 'tkinter', 'multiprocessing')
+
+
+def import_times(module):
+    """
+    Imports a module in a fresh interpreter with -X importtime.
+
+    :param module: name of the module to import
+    :return: list of (self microseconds, cumulative microseconds, module name), in import order
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            capture_output=True, text=True, check=True)
+    times = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        times.append((int(own), int(cumulative), name.strip()))
+    return times
+
+
+def time_to_menu(csv_file):
+    """
+    Starts main.py, enters the csv file and waits until the menu is printed, then chooses Exit.
+
+    :param csv_file: path to the csv file to enter at the prompt
+    :return: seconds from starting the process until the menu appeared
+    """
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, 'main.py'], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                               text=True, env={**os.environ, 'PYTHONUNBUFFERED': '1'})
+    process.stdin.write(csv_file + '\n')
+    process.stdin.flush()
+    seen = ''
+    while 'Menu:' not in seen:
+        character = process.stdout.read(1)
+        if not character:
+            raise RuntimeError("main.py exited before showing the menu")
+        seen = seen[-10:] + character
+    elapsed = time.perf_counter() - start
+    process.communicate('13\n')
+    return elapsed
+
+
+def main():
+    csv_file = sys.argv[1] if len(sys.argv) > 1 else 'retail_sales_data.csv'
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    import_times('main')  # the first run may compile the modules, so it isn't counted
+
+    runs = [import_times('main') for _ in range(repeats)]
+    totals = [next(cumulative for _, cumulative, name in times if name == 'main') for times in runs]
+    print(f"import main: {statistics.median(totals) / 1000:.1f} ms (median of {repeats})")
+    print("slowest imports (cumulative ms):")
+    for own, cumulative, name in sorted(runs[-1], key=lambda entry: -entry[1])[:10]:
+        print(f"  {cumulative / 1000:8.1f}  {name}")
+    imported = {name.split('.')[0] for _, _, name in runs[-1]}
+    for module in LAZY_MODULES:
+        print(f"{module}: {'imported at start-up' if module in imported else 'not imported'}")
+
+    menu = [time_to_menu(csv_file) for _ in range(repeats)]
+    print(f"start to first menu: {statistics.median(menu) * 1000:.1f} ms (median of {repeats})")
+
+
+if __name__ == "__main__":
+    main()
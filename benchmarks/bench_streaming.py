@@ -0,0 +1,57 @@
+"""
+Compares peak memory (RSS) of loading a csv file against streaming it in chunks.
+
+Run from the project folder:  python -m benchmarks.bench_streaming [rows] [chunk sizes...]
+Each mode runs in its own process, because peak RSS can only grow within a process.
+"""
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.generator import write_csv
+from data_processor import DataProcessor
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def run_once(path, chunk_size):
+    """
+    Loads (chunk_size 0) or streams the file, computes the summaries and prints the measurements.
+    """
+    start = time.perf_counter()
+    if chunk_size:
+        processor = DataProcessor(path, streaming=True, chunk_size=chunk_size)
+    else:
+        processor = DataProcessor(path)
+    processor.get_total_transactions()
+    processor.group_by_location()
+    processor.sales_summary('Rural')
+    elapsed = time.perf_counter() - start
+    mode = f"streaming, chunk {chunk_size}" if chunk_size else "load_data"
+    print(f"{mode:28} {elapsed:8.2f} s   peak RSS {peak_rss_mb():8.1f} MB")
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == '--run':
+        run_once(sys.argv[2], int(sys.argv[3]))
+        return
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 10 ** 6
+    chunk_sizes = [int(size) for size in sys.argv[2:]] or [10000, 100000]
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, 'transactions.csv')
+        write_csv(path, rows)
+        print(f"rows: {rows}, file size: {os.path.getsize(path) / (1024 * 1024):.1f} MB")
+        for chunk_size in [0] + chunk_sizes:
+            subprocess.run([sys.executable, '-m', 'benchmarks.bench_streaming', '--run', path, str(chunk_size)],
+                           check=True)
+
+
+if __name__ == "__main__":
+    main()
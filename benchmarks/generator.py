@@ -0,0 +1,119 @@
+"""
+Generates synthetic retail transactions with the same columns as retail_sales_data.csv.
+
+Run from the project folder:  python -m benchmarks.generator transactions.csv --rows 1000000
+"""
+import argparse
+import csv
+import random
+from datetime import date
+
+FIELDNAMES = ['TransactionID', 'CustomerID', 'StoreLocation', 'ProductCategory', 'ProductID', 'Quantity',
+              'UnitPrice', 'TransactionDate', 'PaymentMethod', 'DiscountApplied', 'CustomerSatisfaction',
+              'TotalPrice']
+# Real values first, extra ones are numbered when a higher cardinality is asked for
+LOCATIONS = ['City Centre', 'Rural', 'Suburban']
+CATEGORIES = ['Electronics', 'Clothing', 'Grocery', 'Home Goods', 'Other']
+PAYMENT_METHODS = ['Cash', 'Credit Card', 'Debit Card', 'Mobile Payment']
+
+
+def _values(known, count, prefix):
+    # The first `count` known values, followed by numbered ones if there aren't enough
+    return known[:count] + [f"{prefix} {i}" for i in range(len(known) + 1, count + 1)]
+
+
+def generate_rows(rows, locations=3, categories=5, payment_methods=4, customers=1000, products=900,
+                  start_date='2022-11-01', days=730, seed=42):
+    """
+    Generates random transactions.
+
+    :param rows: number of transactions
+    :param locations: number of distinct store locations
+    :param categories: number of distinct product categories
+    :param payment_methods: number of distinct payment methods
+    :param customers: number of distinct customer IDs
+    :param products: number of distinct product IDs
+    :param start_date: first transaction date, as 'YYYY-MM-DD'
+    :param days: number of days the transaction dates are spread over
+    :param seed: random seed, the same seed always gives the same rows
+    :return: generator of rows, each a list of strings in FIELDNAMES order
+    """
+    rng = random.Random(seed)
+    location_values = _values(LOCATIONS, locations, 'Store')
+    category_values = _values(CATEGORIES, categories, 'Category')
+    payment_values = _values(PAYMENT_METHODS, payment_methods, 'Method')
+    first_day = date.fromisoformat(start_date).toordinal()
+    for transaction_id in range(1, rows + 1):
+        quantity = rng.randint(1, 9)
+        unit_price = round(rng.uniform(5, 500), 2)
+        yield [
+            str(transaction_id),
+            str(1000 + rng.randrange(customers)),
+            rng.choice(location_values),
+            rng.choice(category_values),
+            str(100 + rng.randrange(products)),
+            str(quantity),
+            repr(unit_price),
+            date.fromordinal(first_day + rng.randrange(days)).isoformat(),
+            rng.choice(payment_values),
+            rng.choice(('Yes', 'No')),
+            str(rng.randint(1, 5)),
+            repr(round(quantity * unit_price, 2)),
+        ]
+
+
+def generate_dicts(rows, **options):
+    """
+    Same as generate_rows, but every row is a dictionary like the ones csv.DictReader returns.
+    """
+    for row in generate_rows(rows, **options):
+        yield dict(zip(FIELDNAMES, row))
+
+
+def write_csv(path, rows, **options):
+    """
+    Writes random transactions to a csv file in the retail_sales_data.csv format.
+
+    :param path: file to write
+    :param rows: number of transactions
+    :param options: cardinalities and other options of generate_rows
+    :return: None
+    """
+    with open(path, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(FIELDNAMES)
+        writer.writerows(generate_rows(rows, **options))
+
+
+def add_generator_arguments(parser):
+    """
+    Adds the options of generate_rows to an argparse parser.
+    """
+    parser.add_argument("--locations", type=int, default=3, help="number of store locations")
+    parser.add_argument("--categories", type=int, default=5, help="number of product categories")
+    parser.add_argument("--payment-methods", type=int, default=4, help="number of payment methods")
+    parser.add_argument("--customers", type=int, default=1000, help="number of distinct customers")
+    parser.add_argument("--products", type=int, default=900, help="number of distinct products")
+    parser.add_argument("--days", type=int, default=730, help="number of days the dates are spread over")
+    parser.add_argument("--seed", type=int, default=42, help="random seed")
+
+
+def generator_options(args):
+    """
+    Collects the generate_rows options from arguments parsed with add_generator_arguments.
+    """
+    return {'locations': args.locations, 'categories': args.categories, 'payment_methods': args.payment_methods,
+            'customers': args.customers, 'products': args.products, 'days': args.days, 'seed': args.seed}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic retail sales csv file.")
+    parser.add_argument("path", help="csv file to write")
+    parser.add_argument("--rows", type=int, default=100000, help="number of transactions")
+    add_generator_arguments(parser)
+    args = parser.parse_args(argv)
+    write_csv(args.path, args.rows, **generator_options(args))
+
+
+if __name__ == "__main__":
+    main()
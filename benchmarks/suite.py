@@ -0,0 +1,171 @@
+"""
+Times the main DataProcessor operations on synthetic data and writes the results as JSON,
+so that runs of different versions can be compared.
+
+Run from the project folder:
+    python -m benchmarks.suite --rows 1000 100000 1000000 --output results.json
+    python -m benchmarks.suite --rows 100000 --compare results.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+from benchmarks.generator import add_generator_arguments, generator_options, write_csv
+from data_processor import DataProcessor
+
+# Number of repeated calls used to time an operation once its indexes and caches are warm
+WARM_REPEAT = 100
+# A slowdown above this ratio is reported as a regression by --compare
+REGRESSION_RATIO = 1.2
+
+
+def measure(function, memory, reset=None):
+    """
+    Calls a function once and measures it.
+
+    :param function: function without arguments
+    :param memory: if True, call it a second time under tracemalloc to find its peak memory use
+    :param reset: function without arguments called before the traced call, e.g. to drop the caches
+                  the first call filled so that both calls start from the same state
+    :return: (result, seconds, peak bytes allocated or None)
+    """
+    start = time.perf_counter()
+    result = function()
+    seconds = time.perf_counter() - start
+    peak = None
+    if memory:
+        if reset is not None:
+            reset()
+        tracemalloc.start()
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result, seconds, peak
+
+
+def run_benchmarks(path, rows, memory=True, seed=42):
+    """
+    Times load_data, get_transaction_details, get_transactions_by_location, group_by_location and
+    sales_summary on one csv file. Each query is timed cold (indexes and caches dropped first) and warm.
+
+    :param path: csv file generated with benchmarks.generator
+    :param rows: number of rows in the file
+    :param memory: if True, also record the peak memory of every operation
+    :param seed: random seed for choosing the transaction IDs that are looked up
+    :return: list of result dictionaries
+    """
+    results = []
+
+    def record(operation, seconds, peak, warm_seconds=None):
+        results.append({
+            'operation': operation,
+            'rows': rows,
+            'seconds': round(seconds, 6),
+            'rows_per_second': round(rows / seconds) if seconds else None,
+            'warm_seconds': None if warm_seconds is None else round(warm_seconds, 9),
+            'peak_memory_bytes': peak,
+        })
+
+    processor, seconds, peak = measure(lambda: DataProcessor(path), memory)
+    record('load_data', seconds, peak)
+
+    rng = random.Random(seed)
+    ids = [str(rng.randint(1, rows)) for _ in range(WARM_REPEAT)]
+    location = processor.get_unique_locations_and_categories()[0][0]
+    queries = [
+        ('get_transaction_details', lambda: processor.get_transaction_details(ids[0]),
+         lambda: [processor.get_transaction_details(transaction_id) for transaction_id in ids]),
+        ('get_transactions_by_location', lambda: processor.get_transactions_by_location(location), None),
+        ('group_by_location', processor.group_by_location, None),
+        ('sales_summary', lambda: processor.sales_summary(location), None),
+    ]
+    for operation, cold, warm in queries:
+        processor.clear_caches()
+        _, seconds, peak = measure(cold, memory, reset=processor.clear_caches)
+        # Warm timing: indexes, running totals and cached results are in place
+        if warm is None:
+            warm = lambda: [cold() for _ in range(WARM_REPEAT)]
+        start = time.perf_counter()
+        warm()
+        warm_seconds = (time.perf_counter() - start) / WARM_REPEAT
+        record(operation, seconds, peak, warm_seconds)
+    return results
+
+
+def git_revision():
+    # The commit being measured, if the project is a git checkout
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, previous_path):
+    """
+    Prints how much faster or slower every operation got compared with an earlier results file.
+
+    :param results: list of result dictionaries of this run
+    :param previous_path: results file written by an earlier run
+    :return: number of operations that got slower than REGRESSION_RATIO
+    """
+    with open(previous_path) as file:
+        previous = {(entry['operation'], entry['rows']): entry for entry in json.load(file)['results']}
+    regressions = 0
+    for entry in results:
+        before = previous.get((entry['operation'], entry['rows']))
+        if before is None or not before['seconds']:
+            continue
+        ratio = entry['seconds'] / before['seconds']
+        flag = "  REGRESSION" if ratio > REGRESSION_RATIO else ""
+        regressions += bool(flag)
+        print(f"{entry['operation']:30} {entry['rows']:>10} rows: {ratio:6.2f}x the previous time{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark DataProcessor on synthetic retail data.")
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 100000],
+                        help="row counts to benchmark, e.g. 1000 100000 10000000")
+    parser.add_argument("--output", default="benchmark_results.json", help="results file to write")
+    parser.add_argument("--compare", metavar="RESULTS", help="earlier results file to compare against")
+    parser.add_argument("--no-memory", action="store_true", help="skip the peak memory measurements")
+    add_generator_arguments(parser)
+    args = parser.parse_args(argv)
+
+    results = []
+    with tempfile.TemporaryDirectory() as folder:
+        for rows in args.rows:
+            path = os.path.join(folder, f"transactions_{rows}.csv")
+            write_csv(path, rows, **generator_options(args))
+            for entry in run_benchmarks(path, rows, memory=not args.no_memory, seed=args.seed):
+                results.append(entry)
+                print(f"{entry['operation']:30} {rows:>10} rows: {entry['seconds']:10.4f} s"
+                      f"   warm {entry['warm_seconds'] or 0:10.6f} s"
+                      f"   peak {(entry['peak_memory_bytes'] or 0) / (1024 * 1024):8.1f} MB")
+
+    with open(args.output, "w") as file:
+        json.dump({
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'generator': generator_options(args),
+            'results': results,
+        }, file, indent=4)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        return compare(results, args.compare)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
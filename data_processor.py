@@ -1,20 +1,1668 @@
 import csv
-from collections import defaultdict
+import hashlib
+import json
+import mmap
+import io
+import math
+import os
+import random
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from collections import OrderedDict
+from collections.abc import Sequence
+from copy import deepcopy
+from datetime import date
+from functools import wraps
+from itertools import accumulate, chain, compress, islice
+
+# Columns stored as typed arrays instead of strings, and how to turn them back into text
+FLOAT_COLUMNS = {'UnitPrice': '{!r}', 'TotalPrice': '{!r}', 'CustomerSatisfaction': '{:g}'}
+INT_COLUMNS = ('Quantity',)
+# Value stored in place of an invalid number, the null mask of the column marks it
+NULL_VALUES = {'d': float('nan'), 'q': 0}
+CURRENCY_SYMBOLS = ('£', '$', '€')
+# Low-cardinality columns stored as integer codes into a list of distinct values
+CATEGORY_COLUMNS = ('StoreLocation', 'ProductCategory', 'PaymentMethod', 'DiscountApplied')
+# Dates stored as proleptic Gregorian ordinals, 0 meaning "missing"
+DATE_COLUMNS = ('TransactionDate',)
+# Column that identifies a transaction
+PRIMARY_KEY = 'TransactionID'
+# Rows per chunk when a file is streamed instead of loaded
+DEFAULT_CHUNK_SIZE = 50000
+# Layout version of the binary cache files, bump it whenever the format changes
+CACHE_VERSION = 5
+CACHE_MAGIC = b'DPCACHE\0'
+# Separator between the values of a text column in the cache. A quoted csv value may contain it too,
+# so the values are found by their offsets, see TextColumn
+TEXT_SEPARATOR = '\x1f'
+TEXT_SEPARATOR_BYTES = TEXT_SEPARATOR.encode('utf-8')
+# Number of aggregate results kept by default in the result cache of a DataProcessor
+DEFAULT_RESULT_CACHE_SIZE = 128
+# Rows aggregated between two checks whether the running query was cancelled
+CANCEL_CHECK_ROWS = 10000
+
+
+# Raised inside a query that was cancelled from another thread, see DataProcessor.cancel_requested
+class QueryCancelled(Exception):
+    pass
+
+
+def check_cancelled(cancelled):
+    """
+    :param cancelled: threading.Event set when the running query should stop, or None if it can't be cancelled
+    :return: None, raises QueryCancelled if the event is set
+    """
+    if cancelled is not None and cancelled.is_set():
+        raise QueryCancelled()
+
+
+def normalize_number(text):
+    """
+    Converts a number written with a currency symbol or separators, such as '£1,234.50',
+    '1.234,50' or '10,50', into a float. When a value has both ',' and '.', the one that comes
+    last is the decimal separator. A lone ',' followed by exactly three digits separates thousands,
+    otherwise it is the decimal separator.
+
+    :param text: the raw value from the csv file
+    :return: the parsed value, or None if it isn't a number
+    """
+    value = text.strip()
+    for symbol in CURRENCY_SYMBOLS:
+        value = value.replace(symbol, '')
+    value = value.replace(' ', '')
+    if ',' in value and '.' in value:
+        if value.rfind(',') > value.rfind('.'):
+            value = value.replace('.', '').replace(',', '.')
+        else:
+            value = value.replace(',', '')
+    elif ',' in value:
+        whole, _, fraction = value.rpartition(',')
+        if value.count(',') > 1 or len(fraction) == 3:
+            value = value.replace(',', '')
+        else:
+            value = whole + '.' + fraction
+    # float() also accepts '1_000', 'nan' and 'inf', none of which is a valid price or quantity
+    if '_' in value:
+        return None
+    try:
+        number = float(value)
+    except ValueError:
+        return None
+    return number if math.isfinite(number) else None
+
+
+def parse_numbers(values, typecode='d'):
+    """
+    Parses a batch of numeric strings into a typed array in one go. Plain numbers are converted
+    by a single map() call; only if the batch contains something else, including 'nan', 'inf'
+    or numbers with underscores, is it parsed value by value with normalize_number.
+
+    :param values: list of raw values from one csv column
+    :param typecode: 'd' for float64 values or 'q' for 64-bit integers
+    :return: (array of parsed values, null mask with 1 for each invalid value, number of invalid values)
+    """
+    convert = float if typecode == 'd' else int
+    try:
+        parsed = array(typecode, map(convert, values))
+    except ValueError:
+        parsed = None
+    # float() and int() accept more than plain numbers, so the fast path is only kept if it saw none of that
+    if parsed is not None and '_' not in ''.join(values) and (typecode != 'd' or all(map(math.isfinite, parsed))):
+        return parsed, bytearray(len(values)), 0
+
+    parsed = array(typecode)
+    mask = bytearray(len(values))
+    nulls = 0
+    for i, text in enumerate(values):
+        try:
+            number = None if '_' in text else convert(text)
+        except ValueError:
+            number = normalize_number(text)
+            if number is not None and typecode != 'd' and not number.is_integer():
+                number = None
+        if number is not None and math.isfinite(number):
+            parsed.append(convert(number))
+        else:
+            parsed.append(NULL_VALUES[typecode])
+            mask[i] = 1
+            nulls += 1
+    return parsed, mask, nulls
+
+
+def parse_date(text):
+    """
+    Converts an ISO date string (YYYY-MM-DD) into a day ordinal.
+
+    :param text: the raw value from the csv file
+    :return: the ordinal of the date, or 0 if it isn't a valid date
+    """
+    try:
+        return date.fromisoformat(text.strip()).toordinal()
+    except ValueError:
+        return 0
+
+
+def format_date(ordinal):
+    """
+    :param ordinal: day ordinal, 0 for a missing date
+    :return: the date as YYYY-MM-DD, or '' if it is missing
+    """
+    return date.fromordinal(ordinal).isoformat() if ordinal else ''
+
+
+# Keeps the transactions column by column with typed values
+class ColumnStore:
+
+    def __init__(self, fieldnames):
+        """
+        Creates an empty store for the given csv header.
+
+        :param fieldnames: the column names from the csv header, in file order
+        """
+        self.fieldnames = list(fieldnames)
+        self.columns = {}
+        self.categories = {}  # column name -> list of distinct values, position is the code
+        self._category_codes = {}  # column name -> {value: code}
+        self.nulls = {}  # numeric column name -> null mask, 1 where the value wasn't a valid number
+        self.null_counts = {}  # numeric column name -> number of invalid values
+        self._size = 0
+        self._primary_index = None  # TransactionID -> position, built on first lookup
+        self._postings = {}  # categorical column name -> list of position arrays, one per code
+        # Typed column name -> (sorted positions, original texts) of the values that can't be rebuilt
+        # from the typed value, e.g. '10.00', '£1,000.50' or a date that isn't written YYYY-MM-DD
+        self.raw = {}
+        for name in self.fieldnames:
+            if name in FLOAT_COLUMNS or name in INT_COLUMNS:
+                self.columns[name] = array('d' if name in FLOAT_COLUMNS else 'q')
+                self.nulls[name] = bytearray()
+                self.null_counts[name] = 0
+                self.raw[name] = (array('q'), [])
+            elif name in DATE_COLUMNS:
+                self.columns[name] = array('l')
+                self.raw[name] = (array('q'), [])
+            elif name in CATEGORY_COLUMNS:
+                self.columns[name] = array('i')
+                self.categories[name] = []
+                self._category_codes[name] = {}
+            else:
+                self.columns[name] = []
+
+    @classmethod
+    def from_columns(cls, fieldnames, columns, categories, size, nulls=None, raw=None):
+        """
+        Creates a store from columns that were already parsed, e.g. read back from the cache.
+        Numeric columns may be read-only memoryviews, they are copied into arrays on the first append.
+
+        :param fieldnames: the column names from the csv header, in file order
+        :param columns: dictionary of column name -> array, memoryview or list
+        :param categories: dictionary of categorical column name -> list of distinct values
+        :param size: number of rows
+        :param nulls: dictionary of numeric column name -> null mask, missing masks mean no invalid values
+        :param raw: dictionary of typed column name -> (positions, texts) of the values kept as loaded
+        :return: the ColumnStore
+        """
+        store = cls(fieldnames)
+        store.columns.update(columns)
+        store.raw.update(raw or {})
+        for name in store.nulls:
+            mask = (nulls or {}).get(name)
+            store.nulls[name] = bytearray(size) if mask is None else mask
+            store.null_counts[name] = 0 if mask is None else size - bytes(mask).count(0)
+        for name, values in categories.items():
+            store.categories[name] = list(values)
+            store._category_codes[name] = {value: code for code, value in enumerate(values)}
+        store._size = size
+        return store
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, name):
+        return name in self.columns
+
+    def append(self, row):
+        """
+        Parses one csv row and adds its values to the end of every column.
+
+        :param row: dictionary of column name -> string value, as produced by csv.DictReader
+        :return: None
+        """
+        self.extend([row])
+
+    def extend(self, rows):
+        """
+        Parses a batch of csv rows column by column and adds them to the end of the store.
+
+        :param rows: list of dictionaries of column name -> string value
+        :return: None
+        """
+        first = self._size
+        for name, column in self.columns.items():
+            if isinstance(column, memoryview):
+                # Columns mapped from the cache are read-only, copy them before the first change
+                column = self.columns[name] = array(column.format, column.tobytes())
+            elif isinstance(column, TextColumn):
+                column = self.columns[name] = list(column)
+            texts = [row.get(name) or '' for row in rows]
+            if name in FLOAT_COLUMNS or name in INT_COLUMNS:
+                parsed, mask, nulls = parse_numbers(texts, column.typecode)
+                column.extend(parsed)
+                if not isinstance(self.nulls[name], bytearray):
+                    self.nulls[name] = bytearray(self.nulls[name])
+                self.nulls[name].extend(mask)
+                self.null_counts[name] += nulls
+                # Each distinct text is rendered back only once, invalid values are rendered as ''
+                render = FLOAT_COLUMNS[name].format if name in FLOAT_COLUMNS else str
+                invalid = {texts[i] for i in compress(range(len(mask)), mask)} if nulls else ()
+                self._keep_raw(name, first, texts, {text for text, value in dict(zip(texts, parsed)).items()
+                                                    if ('' if text in invalid else render(value)) != text})
+            elif name in DATE_COLUMNS:
+                # Dates repeat a lot, so each distinct string is parsed only once per batch
+                ordinals = {text: parse_date(text) for text in set(texts)}
+                column.extend([ordinals[text] for text in texts])
+                self._keep_raw(name, first, texts, {text for text, ordinal in ordinals.items()
+                                                    if format_date(ordinal) != text})
+            elif name in CATEGORY_COLUMNS:
+                column.extend([self.encode(name, text) for text in texts])
+            else:
+                column.extend(texts)
+        self._size += len(rows)
+        if self._primary_index is not None or self._postings:
+            for position in range(first, self._size):
+                self._index_row(position)
+
+    def _keep_raw(self, name, first, texts, changed):
+        """
+        Remembers the original text of the new values that value() can't rebuild from the typed column.
+
+        :param name: name of a typed column
+        :param first: position of the first new row
+        :param texts: the new values as loaded
+        :param changed: set of the texts that would come back differently
+        :return: None
+        """
+        if not changed:
+            return
+        changed = list(compress(range(len(texts)), map(changed.__contains__, texts)))
+        positions, originals = self.raw[name]
+        if isinstance(positions, memoryview):
+            positions = array('q', positions)
+        if not isinstance(originals, list):
+            originals = list(originals)
+        positions.extend(first + i for i in changed)
+        originals.extend(texts[i] for i in changed)
+        self.raw[name] = (positions, originals)
+
+    def raw_text(self, name, position):
+        """
+        :param name: column name
+        :param position: row position in the store
+        :return: the text the value was loaded from if the typed column can't rebuild it, otherwise None
+        """
+        kept = self.raw.get(name)
+        if kept is None or not len(kept[0]):
+            return None
+        positions, originals = kept
+        i = bisect_left(positions, position)
+        if i < len(positions) and positions[i] == position:
+            return originals[i]
+        return None
+
+    def is_null(self, name, position):
+        """
+        :param name: column name
+        :param position: row position in the store
+        :return: True if the value at that position wasn't a valid number
+        """
+        return name in self.nulls and self.null_counts[name] > 0 and self.nulls[name][position] == 1
+
+    def valid_values(self, name):
+        """
+        Returns the values of a numeric column without the invalid ones.
+
+        :param name: name of a numeric column
+        :return: the column itself if it has no invalid values, otherwise a list of the valid ones
+        """
+        column = self.columns[name]
+        if not self.null_counts.get(name):
+            return column
+        return [value for value, null in zip(column, self.nulls[name]) if not null]
+
+    def _index_row(self, position):
+        """
+        Adds a newly appended row to every index that has already been built.
+
+        :param position: row position of the new row
+        :return: None
+        """
+        if self._primary_index is not None:
+            self._primary_index.setdefault(self.columns[PRIMARY_KEY][position], position)
+        for name, postings in self._postings.items():
+            code = self.columns[name][position]
+            while len(postings) <= code:
+                postings.append(array('q'))
+            postings[code].append(position)
+
+    def drop_indexes(self):
+        """
+        Forgets the hash indexes, they are built again on the next lookup.
+
+        :return: None
+        """
+        self._primary_index = None
+        self._postings = {}
+
+    def find(self, key):
+        """
+        Finds a row by its TransactionID using a hash index.
+
+        :param key: the TransactionID to look for
+        :return: the position of the first row with that ID, or None if there isn't one
+        """
+        if PRIMARY_KEY not in self.columns:
+            return None
+        if self._primary_index is None:
+            index = {}
+            for position, value in enumerate(self.columns[PRIMARY_KEY]):
+                index.setdefault(value, position)
+            self._primary_index = index
+        return self._primary_index.get(key)
+
+    def positions(self, name, value):
+        """
+        Returns the positions of the rows where a categorical column has the given value.
+        The posting lists for a column are built the first time it is queried.
+
+        :param name: name of a categorical column
+        :param value: string value to look for
+        :return: array of row positions in load order
+        """
+        code = self.code_of(name, value)
+        if code is None:
+            return array('q')
+        postings = self._postings.get(name)
+        if postings is None:
+            postings = [array('q') for _ in self.categories[name]]
+            for position, stored in enumerate(self.columns[name]):
+                postings[stored].append(position)
+            self._postings[name] = postings
+        return postings[code]
+
+    def encode(self, name, value):
+        """
+        Returns the integer code of a categorical value, adding it to the dictionary if it is new.
+
+        :param name: name of a categorical column
+        :param value: the string value to encode
+        :return: the code for the value
+        """
+        codes = self._category_codes[name]
+        code = codes.get(value)
+        if code is None:
+            code = len(self.categories[name])
+            codes[value] = code
+            self.categories[name].append(value)
+        return code
+
+    def code_of(self, name, value):
+        """
+        Looks up the code of a categorical value without adding it.
+
+        :param name: name of a categorical column
+        :param value: the string value to look up
+        :return: the code, or None if the value never occurs in the column
+        """
+        return self._category_codes[name].get(value)
+
+    def value(self, name, position):
+        """
+        Turns the stored value at a position back into the string it was loaded from.
+
+        :param name: column name
+        :param position: row position in the store
+        :return: the value as text
+        """
+        stored = self.columns[name][position]
+        if name in self.raw:
+            original = self.raw_text(name, position)
+            if original is not None:
+                return original
+        if self.is_null(name, position):
+            return ''
+        if name in FLOAT_COLUMNS:
+            return FLOAT_COLUMNS[name].format(stored)
+        if name in INT_COLUMNS:
+            return str(stored)
+        if name in DATE_COLUMNS:
+            return format_date(stored)
+        if name in CATEGORY_COLUMNS:
+            return self.categories[name][stored]
+        return stored
+
+    def row(self, position):
+        """
+        Builds the csv-style dictionary for one row.
+
+        :param position: row position in the store
+        :return: dictionary of column name -> string value
+        """
+        return {name: self.value(name, position) for name in self.fieldnames}
+
+
+# Read-only text column mapped from the cache, a value is only decoded when it is accessed
+class TextColumn(Sequence):
+
+    def __init__(self, blob, offsets):
+        """
+        :param blob: the utf-8 encoded values joined with TEXT_SEPARATOR
+        :param offsets: int64 start offset of every value in the blob, plus one past the end of the last
+        """
+        self.blob = blob
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('text column index out of range')
+        return str(self.blob[self.offsets[index]:self.offsets[index + 1] - 1], 'utf-8')
+
+    def __iter__(self):
+        if not len(self):
+            return iter(())
+        # Decoding the whole blob in one go is much faster than value by value, but only gives
+        # the right values if none of them contains the separator itself
+        values = str(self.blob, 'utf-8').split(TEXT_SEPARATOR)
+        if len(values) == len(self):
+            return iter(values)
+        offsets = self.offsets
+        return (str(self.blob[offsets[i]:offsets[i + 1] - 1], 'utf-8') for i in range(len(self)))
+
+
+def encode_texts(values):
+    """
+    Encodes text values in the layout read back by TextColumn.
+
+    :param values: sequence of strings
+    :return: (blob of the values joined with TEXT_SEPARATOR, array of the start offsets plus the end)
+    """
+    encoded = [value.encode('utf-8') for value in values]
+    return TEXT_SEPARATOR_BYTES.join(encoded), array('q', accumulate((len(value) + 1 for value in encoded), initial=0))
+
+
+# Read-only list of row dictionaries that are only built when accessed
+class RowView(Sequence):
+
+    def __init__(self, store, positions=None):
+        """
+        :param store: the ColumnStore to read rows from
+        :param positions: row positions to expose, or None for every row in the store
+        """
+        self.store = store
+        self.positions = positions
+
+    def __len__(self):
+        return len(self.store) if self.positions is None else len(self.positions)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if self.positions is None:
+            if index < 0:
+                index += len(self.store)
+            if not 0 <= index < len(self.store):
+                raise IndexError('row index out of range')
+            return self.store.row(index)
+        return self.store.row(self.positions[index])
+
+    def __iter__(self):
+        positions = range(len(self.store)) if self.positions is None else self.positions
+        for position in positions:
+            yield self.store.row(position)
+
+
+# Read-only list of the rows of a streamed file, read again from the file on every access
+class StreamedRows(Sequence):
+
+    def __init__(self, processor):
+        """
+        :param processor: the streaming DataProcessor whose rows are exposed
+        """
+        self.processor = processor
+
+    def __len__(self):
+        return self.processor.get_total_transactions()
+
+    def __getitem__(self, index):
+        # Indexing reads the file up to the row, so iterate instead of indexing in a loop
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step < 0:
+                return list(self)[index]
+            return list(islice(self, start, stop, step))
+        if index < 0:
+            index += len(self)
+        if index >= 0:
+            for chunk in self.processor._stores():
+                if index < len(chunk):
+                    return chunk.row(index)
+                index -= len(chunk)
+        raise IndexError('row index out of range')
+
+    def __iter__(self):
+        for chunk in self.processor._stores():
+            yield from RowView(chunk)
+
+# Numeric and categorical columns that make up a sales summary
+SUMMARY_NUMERIC = ('TotalPrice', 'Quantity', 'CustomerSatisfaction')
+SUMMARY_COUNTED = ('PaymentMethod',)
+
+
+# Running aggregates for one group of rows
+class GroupAggregate:
+
+    def __init__(self, numeric, counted):
+        """
+        :param numeric: names of the numeric columns to sum, average and take min/max of
+        :param counted: names of the categorical columns to count values of
+        """
+        self.numeric = tuple(numeric)
+        self.counted = tuple(counted)
+        self.count = 0
+        self.sums = [0] * len(self.numeric)
+        self.valid = [0] * len(self.numeric)  # number of valid (non-null) values per numeric column
+        self.mins = [None] * len(self.numeric)
+        self.maxs = [None] * len(self.numeric)
+        self.value_counts = [{} for _ in self.counted]
+
+    def add(self, values, labels):
+        """
+        Adds one row to the aggregates.
+
+        :param values: the row's numeric values, in the order of self.numeric, None for invalid values
+        :param labels: the row's categorical values, in the order of self.counted
+        :return: None
+        """
+        self.count += 1
+        sums, mins, maxs = self.sums, self.mins, self.maxs
+        for i, value in enumerate(values):
+            if value is None:
+                continue
+            sums[i] += value
+            self.valid[i] += 1
+            if mins[i] is None or value < mins[i]:
+                mins[i] = value
+            if maxs[i] is None or value > maxs[i]:
+                maxs[i] = value
+        for counts, label in zip(self.value_counts, labels):
+            counts[label] = counts.get(label, 0) + 1
+
+    def merge(self, other):
+        """
+        Adds the aggregates of another group, e.g. the same location in another chunk of the file.
+
+        :param other: GroupAggregate over the same numeric and counted columns
+        :return: None
+        """
+        self.count += other.count
+        for i in range(len(self.numeric)):
+            self.sums[i] += other.sums[i]
+            self.valid[i] += other.valid[i]
+            if other.mins[i] is not None and (self.mins[i] is None or other.mins[i] < self.mins[i]):
+                self.mins[i] = other.mins[i]
+            if other.maxs[i] is not None and (self.maxs[i] is None or other.maxs[i] > self.maxs[i]):
+                self.maxs[i] = other.maxs[i]
+        for counts, other_counts in zip(self.value_counts, other.value_counts):
+            for label, count in other_counts.items():
+                counts[label] = counts.get(label, 0) + count
+
+    def sum(self, name):
+        return self.sums[self.numeric.index(name)] if name in self.numeric else 0
+
+    def mean(self, name):
+        # Invalid values are left out of the average
+        valid = self.valid[self.numeric.index(name)] if name in self.numeric else 0
+        return self.sum(name) / valid if valid else 0
+
+    def min(self, name):
+        return self.mins[self.numeric.index(name)] if name in self.numeric else None
+
+    def max(self, name):
+        return self.maxs[self.numeric.index(name)] if name in self.numeric else None
+
+    def counts(self, name):
+        """
+        :param name: name of a counted column
+        :return: dictionary of value -> number of rows, in order of first appearance
+        """
+        return dict(self.value_counts[self.counted.index(name)]) if name in self.counted else {}
+
+
+def aggregate(store, by, numeric=SUMMARY_NUMERIC, counted=SUMMARY_COUNTED, positions=None, cancelled=None):
+    """
+    Computes count, sum, mean, min, max and value counts for every group in a single pass over the rows.
+
+    :param store: the ColumnStore to read from
+    :param by: name of the column to group by, a tuple of names to group by their combinations,
+               or None to put every row in one group
+    :param numeric: numeric columns to aggregate, columns missing from the store are skipped
+    :param counted: categorical columns to count values of, columns missing from the store are skipped
+    :param positions: row positions to aggregate, or None for every row
+    :param cancelled: optional threading.Event checked every CANCEL_CHECK_ROWS rows, see check_cancelled
+    :return: dictionary of group value (as text, or a tuple of texts when by is a tuple) -> GroupAggregate
+    """
+    numeric = [name for name in numeric if name in store]
+    counted = [name for name in counted if name in store]
+    numeric_columns = [store.columns[name] for name in numeric]
+    # Null masks are only consulted for columns that actually contain invalid values
+    null_masks = [store.nulls[name] if store.null_counts[name] else None for name in numeric]
+    counted_columns = [store.columns[name] for name in counted]
+    key_names = by if isinstance(by, tuple) else (by,) if by is not None else ()
+    key_columns = [store.columns[name] for name in key_names]
+    if positions is None:
+        positions = range(len(store))
+
+    groups = {}  # stored key -> (first position, GroupAggregate)
+    for begin in range(0, len(positions), CANCEL_CHECK_ROWS):
+        check_cancelled(cancelled)
+        for position in positions[begin:begin + CANCEL_CHECK_ROWS]:
+            if len(key_columns) == 1:
+                key = key_columns[0][position]
+            else:
+                key = tuple(column[position] for column in key_columns)
+            entry = groups.get(key)
+            if entry is None:
+                entry = groups[key] = (position, GroupAggregate(numeric, counted))
+            entry[1].add([None if mask is not None and mask[position] else column[position]
+                          for column, mask in zip(numeric_columns, null_masks)],
+                         [column[position] for column in counted_columns])
+
+    # Turn the stored keys and categorical codes back into text
+    result = {}
+    for key, (first_position, group) in groups.items():
+        for i, name in enumerate(counted):
+            if name in CATEGORY_COLUMNS:
+                group.value_counts[i] = {store.categories[name][code]: count
+                                         for code, count in group.value_counts[i].items()}
+        if isinstance(by, tuple):
+            result[tuple(store.value(name, first_position) for name in by)] = group
+        else:
+            result[store.value(by, first_position) if by is not None else None] = group
+    return result
+
+
+def format_summary(group):
+    """
+    Formats the aggregates of one group as a sales summary.
+
+    :param group: GroupAggregate computed with the summary columns
+    :return: sales summary dictionary
+    """
+    total_transactions = group.count
+    # Calculate the percentage of each payment method
+    payment_method_percentage = [
+        f"{method}: {(count / total_transactions) * 100:.2f}%"
+        for method, count in group.counts('PaymentMethod').items()
+    ]
+    # Return the sales summary as a dictionary
+    return {
+        "Total Transactions": total_transactions,
+        "Total Revenue": format(group.sum('TotalPrice'), '.2f'),
+        "Average Transaction Value": format(group.mean('TotalPrice'), '.2f'),
+        "Total Quantity Sold": group.sum('Quantity'),
+        "Average Customer Satisfaction": format(group.mean('CustomerSatisfaction'), '.2f'),
+        "Payment Method Percentage": ', '.join(payment_method_percentage)
+    }
+
+
+def read_chunks(file_path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Reads a csv file in chunks so that only one chunk is held in memory at a time.
+
+    :param file_path: path to the csv file
+    :param chunk_size: maximum number of rows per chunk
+    :return: generator of ColumnStore chunks
+    """
+    with open(file_path, mode='r', encoding='utf-8') as file:
+        yield from chunk_rows(csv.DictReader(file), chunk_size)
+
+
+def chunk_rows(reader, chunk_size):
+    """
+    Groups the rows of a csv.DictReader into ColumnStore chunks.
+
+    :param reader: csv.DictReader to take the rows from
+    :param chunk_size: maximum number of rows per chunk
+    :return: generator of ColumnStore chunks
+    """
+    fieldnames = reader.fieldnames or []
+    while True:
+        rows = list(islice(reader, chunk_size))
+        if not rows:
+            break
+        chunk = ColumnStore(fieldnames)
+        chunk.extend(rows)
+        yield chunk
+
+
+# Bytes read at a time while looking for record boundaries
+SCAN_BLOCK_SIZE = 1 << 20
+
+
+def _next_record(file, position, quotes, target):
+    """
+    Finds the start of the first csv record that begins after a byte offset. A line break only ends
+    a record when an even number of quote characters comes before it, otherwise it is inside a quoted field.
+
+    :param file: csv file opened in binary mode
+    :param position: offset where the count of quotes so far is known, at the start of a record
+    :param quotes: number of quote characters before position
+    :param target: the record must start after this offset, which is at least position
+    :return: (offset of the record start or the end of the file, number of quote characters before it)
+    """
+    file.seek(position)
+    while position < target:
+        block = file.read(min(SCAN_BLOCK_SIZE, target - position))
+        if not block:
+            return position, quotes
+        quotes += block.count(b'"')
+        position += len(block)
+    while True:
+        block = file.read(SCAN_BLOCK_SIZE)
+        if not block:
+            return position, quotes
+        start = 0
+        while True:
+            newline = block.find(b'\n', start)
+            if newline < 0:
+                break
+            quotes += block.count(b'"', start, newline)
+            start = newline + 1
+            if quotes % 2 == 0:
+                return position + start, quotes
+        quotes += block.count(b'"', start)
+        position += len(block)
+
+
+def split_shards(file_path, shards):
+    """
+    Splits a csv file into byte ranges that start and end on record boundaries. Quoted fields
+    may contain line breaks: the quote characters are counted to tell them from the ends of records.
+    If the file has an odd number of quotes the count can't be trusted, and the whole file is one range.
+
+    :param file_path: path to the csv file
+    :param shards: number of ranges wanted
+    :return: list of (begin, end) byte offsets covering every row after the header
+    """
+    size = os.path.getsize(file_path)
+    with open(file_path, mode='rb') as file:
+        position, quotes = _next_record(file, 0, 0, 0)  # skip the header
+        first = position
+        bounds = [first]
+        for i in range(1, shards):
+            target = first + (size - first) * i // shards - 1
+            if target >= position:
+                position, quotes = _next_record(file, position, quotes, target)
+            bounds.append(position)
+        bounds.append(size)
+        # A stray quote in an unquoted field would shift the count, the serial reader handles it the way csv does
+        file.seek(position)
+        while True:
+            block = file.read(SCAN_BLOCK_SIZE)
+            if not block:
+                break
+            quotes += block.count(b'"')
+        if quotes % 2:
+            bounds = [first, size]
+    return [(begin, end) for begin, end in zip(bounds, bounds[1:]) if begin < end]
+
+
+def _shard_lines(file, end):
+    # Yields the lines of an open binary file up to the byte offset end
+    while file.tell() < end:
+        line = file.readline()
+        if not line:
+            break
+        yield line.decode('utf-8')
+
+
+def shard_chunks(file_path, begin, end, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Reads one byte range of a csv file in chunks, using the header at the start of the file.
+
+    :param file_path: path to the csv file
+    :param begin: byte offset of the first line of the range
+    :param end: byte offset just after the last line of the range
+    :param chunk_size: maximum number of rows per chunk
+    :return: generator of ColumnStore chunks
+    """
+    with open(file_path, mode='rb') as file:
+        fieldnames = next(csv.reader([file.readline().decode('utf-8')]))
+        file.seek(begin)
+        yield from chunk_rows(csv.DictReader(_shard_lines(file, end), fieldnames=fieldnames), chunk_size)
+
+
+def aggregate_shard(file_path, begin, end, chunk_size=DEFAULT_CHUNK_SIZE, summarise_by=()):
+    """
+    Parses and aggregates one byte range of a csv file. Runs inside a worker process.
+
+    :param file_path: path to the csv file
+    :param begin: byte offset of the first line of the range
+    :param end: byte offset just after the last line of the range
+    :param chunk_size: number of rows parsed at a time
+    :param summarise_by: more columns to keep summary totals for, see StreamingAggregator
+    :return: StreamingAggregator with the totals of the range
+    """
+    streamed = StreamingAggregator(summarise_by)
+    for chunk in shard_chunks(file_path, begin, end, chunk_size):
+        streamed.update(chunk)
+    with open(file_path, mode='r', encoding='utf-8') as file:
+        streamed.fieldnames = next(csv.reader(file))
+    return streamed
+
+
+# Running totals that are updated chunk by chunk while a file is streamed or rows are appended
+class StreamingAggregator:
+
+    def __init__(self, summarise_by=()):
+        """
+        :param summarise_by: columns to keep summary totals for next to the store locations,
+                             e.g. ('ProductCategory',), so their summaries need no second pass
+        """
+        self.fieldnames = []
+        self.rows = 0
+        self.locations = {}  # store location -> GroupAggregate over the summary columns
+        self.categories = {}  # product categories in order of first appearance, used as an ordered set
+        self.groups = {name: {} for name in summarise_by}  # column name -> {value: GroupAggregate}
+
+    def update(self, chunk, positions=None, cancelled=None):
+        """
+        Folds one chunk of rows into the running totals. If the update is cancelled the totals are
+        left half updated, so only totals that are thrown away on QueryCancelled should be cancellable.
+
+        :param chunk: ColumnStore holding the next rows of the file
+        :param positions: positions of the new rows in the chunk, or None if every row is new
+        :param cancelled: optional threading.Event, see check_cancelled
+        :return: None
+        """
+        self.fieldnames = chunk.fieldnames
+        if positions is None:
+            self.rows += len(chunk)
+            for category in chunk.categories.get('ProductCategory', []):
+                self.categories.setdefault(category)
+        else:
+            self.rows += len(positions)
+            if 'ProductCategory' in chunk:
+                column = chunk.columns['ProductCategory']
+                for position in positions:
+                    self.categories.setdefault(chunk.categories['ProductCategory'][column[position]])
+        if 'StoreLocation' in chunk:
+            merge_groups(self.locations, aggregate(chunk, 'StoreLocation', positions=positions, cancelled=cancelled))
+        for name, groups in self.groups.items():
+            if name in chunk:
+                merge_groups(groups, aggregate(chunk, name, positions=positions, cancelled=cancelled))
+
+    def merge(self, other):
+        """
+        Adds the totals of a later part of the file, e.g. the next shard read by another process.
+
+        :param other: StreamingAggregator for the rows that follow the ones already counted
+        :return: None
+        """
+        self.fieldnames = self.fieldnames or other.fieldnames
+        self.rows += other.rows
+        for category in other.categories:
+            self.categories.setdefault(category)
+        merge_groups(self.locations, other.locations)
+        for name, groups in other.groups.items():
+            merge_groups(self.groups.setdefault(name, {}), groups)
+
+    def summaries(self, columns):
+        """
+        :param columns: column names
+        :return: dictionary of column name -> {value: GroupAggregate}, or None if a column has no totals here
+        """
+        if not all(name == 'StoreLocation' or name in self.groups for name in columns):
+            return None
+        return {name: self.locations if name == 'StoreLocation' else self.groups[name] for name in columns}
+
+
+def merge_groups(groups, other):
+    """
+    Adds the groups of a later part of the data to the ones counted so far.
+
+    :param groups: dictionary of value -> GroupAggregate, updated in place
+    :param other: dictionary of value -> GroupAggregate over the same columns
+    :return: None
+    """
+    for value, group in other.items():
+        if value in groups:
+            groups[value].merge(group)
+        else:
+            groups[value] = group
+
+
+def fingerprint(file_path):
+    """
+    Describes the current version of a file for the cache: its path, size, modification time
+    and a hash of its first and last megabyte, so that a check stays fast on multi-GB files.
+
+    :param file_path: path to the csv file
+    :return: dictionary that changes whenever the file does
+    """
+    status = os.stat(file_path)
+    sample = hashlib.blake2b(digest_size=16)
+    with open(file_path, mode='rb') as file:
+        sample.update(file.read(1 << 20))
+        if status.st_size > 2 << 20:
+            file.seek(-(1 << 20), os.SEEK_END)
+            sample.update(file.read())
+    return {
+        'version': CACHE_VERSION,
+        'byteorder': sys.byteorder,
+        'path': os.path.abspath(file_path),
+        'size': status.st_size,
+        'mtime_ns': status.st_mtime_ns,
+        'hash': sample.hexdigest(),
+    }
+
+
+def cache_path_for(file_path, cache_dir=None):
+    """
+    Chooses where the cache of a csv file lives: next to the file, or in cache_dir if one is given.
+
+    :param file_path: path to the csv file
+    :param cache_dir: optional folder for cache files
+    :return: path of the cache file
+    """
+    if cache_dir is None:
+        return file_path + '.cache'
+    digest = hashlib.blake2b(os.path.abspath(file_path).encode('utf-8'), digest_size=6).hexdigest()
+    return os.path.join(cache_dir, f"{os.path.basename(file_path)}-{digest}.cache")
+
+
+def write_cache(store, cache_path, key):
+    """
+    Writes the columns of a store to a binary cache file. The file starts with a json header
+    describing the columns, followed by the raw bytes of every column aligned to 8 bytes.
+    Text columns are stored as their joined values followed by the offset of every value, so that
+    they can be mapped back without splitting them into Python strings.
+
+    :param store: the ColumnStore to save
+    :param cache_path: path of the cache file
+    :param key: fingerprint of the csv file the store was parsed from
+    :return: None
+    """
+    blobs = []
+    layout = {}
+    offset = 0
+    for name, column in store.columns.items():
+        if not isinstance(column, (array, memoryview)):
+            blob, offsets = encode_texts(column)
+            blob += b'\0' * (-len(blob) % 8)
+            layout[name] = {'typecode': None, 'offset': offset, 'length': len(blob),
+                            'offsets_length': len(offsets) * offsets.itemsize}
+            blob += offsets.tobytes()
+        else:
+            blob = bytes(column) if isinstance(column, memoryview) else column.tobytes()
+            layout[name] = {'typecode': column.format if isinstance(column, memoryview) else column.typecode,
+                            'offset': offset, 'length': len(blob)}
+        blob += b'\0' * (-len(blob) % 8)
+        blobs.append(blob)
+        offset += len(blob)
+    nulls = {}
+    for name, mask in store.nulls.items():
+        if store.null_counts[name]:
+            blob = bytes(mask)
+            nulls[name] = {'offset': offset, 'length': len(blob)}
+            blob += b'\0' * (-len(blob) % 8)
+            blobs.append(blob)
+            offset += len(blob)
+    raw = {}
+    for name, (positions, originals) in store.raw.items():
+        if not len(positions):
+            continue
+        raw[name] = {}
+        positions = bytes(positions) if isinstance(positions, memoryview) else positions.tobytes()
+        texts, offsets = encode_texts(originals)
+        for part, blob in (('positions', positions), ('texts', texts), ('offsets', offsets.tobytes())):
+            raw[name][part] = {'offset': offset, 'length': len(blob)}
+            blob += b'\0' * (-len(blob) % 8)
+            blobs.append(blob)
+            offset += len(blob)
+    header = json.dumps({
+        'key': key,
+        'fieldnames': store.fieldnames,
+        'rows': len(store),
+        'categories': store.categories,
+        'columns': layout,
+        'nulls': nulls,
+        'raw': raw,
+    }).encode('utf-8')
+    header += b' ' * (-(len(CACHE_MAGIC) + 8 + len(header)) % 8)
+
+    # Write to a temporary file first so that a crash never leaves half a cache behind
+    temporary_path = cache_path + '.tmp'
+    with open(temporary_path, mode='wb') as file:
+        file.write(CACHE_MAGIC)
+        file.write(len(header).to_bytes(8, 'little'))
+        file.write(header)
+        for blob in blobs:
+            file.write(blob)
+    os.replace(temporary_path, cache_path)
+
+
+def read_cache(cache_path, key):
+    """
+    Memory-maps a cache file written by write_cache, if it exists and matches the csv file.
+
+    :param cache_path: path of the cache file
+    :param key: fingerprint of the csv file as it is now
+    :return: ColumnStore backed by the mapped file, or None if the cache is missing or stale
+    """
+    try:
+        with open(cache_path, mode='rb') as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                return None
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except OSError:
+        return None
+    if mapped[:len(CACHE_MAGIC)] != CACHE_MAGIC:
+        return None
+    header_end = len(CACHE_MAGIC) + 8 + int.from_bytes(mapped[len(CACHE_MAGIC):len(CACHE_MAGIC) + 8], 'little')
+    try:
+        header = json.loads(mapped[len(CACHE_MAGIC) + 8:header_end].decode('utf-8'))
+    except ValueError:
+        return None  # a damaged cache is simply rebuilt
+    if header.get('key') != key:
+        return None
+
+    view = memoryview(mapped)
+    columns = {}
+    for name, layout in header['columns'].items():
+        begin = header_end + layout['offset']
+        blob = view[begin:begin + layout['length']]
+        if layout['typecode'] is None:
+            # Text values stay encoded in the mapped file, TextColumn decodes them when they are read
+            end = begin + layout['length']
+            offsets = view[end:end + layout['offsets_length']].cast('q')
+            columns[name] = TextColumn(blob[:offsets[-1] - 1] if len(offsets) > 1 else blob[:0], offsets)
+        else:
+            columns[name] = blob.cast(layout['typecode'])
+    nulls = {}
+    for name, layout in header['nulls'].items():
+        begin = header_end + layout['offset']
+        nulls[name] = view[begin:begin + layout['length']]
+    raw = {}
+    for name, layout in header['raw'].items():
+        parts = {part: view[header_end + place['offset']:header_end + place['offset'] + place['length']]
+                 for part, place in layout.items()}
+        raw[name] = (parts['positions'].cast('q'), TextColumn(parts['texts'], parts['offsets'].cast('q')))
+    return ColumnStore.from_columns(header['fieldnames'], columns, header['categories'], header['rows'], nulls, raw)
+
+
+# Columns the rollup cube is keyed by, next to the day of the transaction
+ROLLUP_DIMENSIONS = ('StoreLocation', 'ProductCategory', 'PaymentMethod')
+ROLLUP_BUCKETS = ('day', 'month', 'year')
+
+
+def to_ordinal(day):
+    """
+    Converts a date given as a datetime.date or an ISO string (YYYY-MM-DD) into a day ordinal.
+
+    :param day: the date, or None
+    :return: the ordinal, or None if day is None
+    """
+    if day is None:
+        return None
+    if isinstance(day, str):
+        day = date.fromisoformat(day.strip())
+    return day.toordinal()
+
+
+def bucket_label(ordinal, bucket):
+    """
+    Names the date bucket a day belongs to: '2023-03-05' for day, '2023-03' for month, '2023' for year.
+
+    :param ordinal: day ordinal, 0 for transactions without a valid date
+    :param bucket: one of ROLLUP_BUCKETS
+    :return: the label of the bucket
+    """
+    if not ordinal:
+        return 'unknown'
+    day = date.fromordinal(ordinal)
+    if bucket == 'year':
+        return f"{day.year}"
+    if bucket == 'month':
+        return f"{day.year}-{day.month:02d}"
+    return day.isoformat()
+
+
+# Pre-aggregated totals per day, store location, product category and payment method
+class RollupCube:
+
+    def __init__(self):
+        self.cells = {}  # day ordinal -> {(location, category, payment method): [count, revenue, quantity,
+        #                                   satisfaction sum, number of satisfaction values]}
+        self.days = []  # sorted day ordinals, used to find the days of a date range with bisect
+
+    def update(self, store, positions=None, cancelled=None):
+        """
+        Adds rows to the cube. New days are inserted in order, so the cube can be kept up to date as data arrives.
+
+        :param store: the ColumnStore to read the rows from
+        :param positions: positions of the rows to add, or None for every row in the store
+        :param cancelled: optional threading.Event checked every CANCEL_CHECK_ROWS rows, a cancelled
+                          update leaves the cube half updated
+        :return: None
+        """
+        if positions is None:
+            positions = range(len(store))
+        missing = [''] * len(positions)
+        dates = store.columns['TransactionDate'] if 'TransactionDate' in store else [0] * len(store)
+        dimensions = []
+        for name in ROLLUP_DIMENSIONS:
+            if name in store:
+                column, values = store.columns[name], store.categories[name]
+                dimensions.append([values[column[p]] for p in positions])
+            else:
+                dimensions.append(missing)
+        measures = []
+        for name in ('TotalPrice', 'Quantity', 'CustomerSatisfaction'):
+            if name in store:
+                column, mask = store.columns[name], store.nulls[name]
+                checked = store.null_counts[name] > 0
+                measures.append([None if checked and mask[p] else column[p] for p in positions])
+            else:
+                measures.append([None] * len(positions))
+
+        for i, position in enumerate(positions):
+            if i % CANCEL_CHECK_ROWS == 0:
+                check_cancelled(cancelled)
+            day = dates[position]
+            day_cells = self.cells.get(day)
+            if day_cells is None:
+                day_cells = self.cells[day] = {}
+                insort(self.days, day)
+            key = (dimensions[0][i], dimensions[1][i], dimensions[2][i])
+            cell = day_cells.get(key)
+            if cell is None:
+                cell = day_cells[key] = [0, 0.0, 0, 0.0, 0]
+            revenue, quantity, satisfaction = measures[0][i], measures[1][i], measures[2][i]
+            cell[0] += 1
+            if revenue is not None:
+                cell[1] += revenue
+            if quantity is not None:
+                cell[2] += quantity
+            if satisfaction is not None:
+                cell[3] += satisfaction
+                cell[4] += 1
+
+    def query(self, start=None, end=None, by=('StoreLocation',), bucket=None, where=None):
+        """
+        Sums the cube cells of a date range. Only the cells of the days in the range are visited,
+        so the cost depends on the number of buckets, not on the number of transactions.
+
+        :param start: first day to include (date or 'YYYY-MM-DD'), or None for no lower bound
+        :param end: last day to include (date or 'YYYY-MM-DD'), or None for no upper bound
+        :param by: dimensions from ROLLUP_DIMENSIONS to group by
+        :param bucket: 'day', 'month' or 'year' to also group by date, or None for the whole range
+        :param where: optional dictionary of dimension -> value that cells have to match
+        :return: dictionary of group -> totals; a group is a tuple of the bucket label (if any) and the
+                 values of the by dimensions, or just the value when it has a single part
+        """
+        if bucket is not None and bucket not in ROLLUP_BUCKETS:
+            raise ValueError(f"Unknown date bucket: {bucket}")
+        selected = [ROLLUP_DIMENSIONS.index(name) for name in by]
+        filters = [(ROLLUP_DIMENSIONS.index(name), value) for name, value in (where or {}).items()]
+        low = 0 if start is None else bisect_left(self.days, to_ordinal(start))
+        high = len(self.days) if end is None else bisect_right(self.days, to_ordinal(end))
+
+        sums = {}
+        for day in self.days[low:high]:
+            label = (bucket_label(day, bucket),) if bucket is not None else ()
+            for key, cell in self.cells[day].items():
+                if any(key[i] != value for i, value in filters):
+                    continue
+                group = label + tuple(key[i] for i in selected)
+                total = sums.get(group)
+                if total is None:
+                    sums[group] = list(cell)
+                else:
+                    for i, value in enumerate(cell):
+                        total[i] += value
+
+        result = {}
+        for group, (count, revenue, quantity, satisfaction, rated) in sorted(sums.items()):
+            result[group[0] if len(group) == 1 else group] = {
+                "Total Transactions": count,
+                "Total Revenue": round(revenue, 2),
+                "Total Quantity Sold": quantity,
+                "Average Customer Satisfaction": round(satisfaction / rated, 2) if rated else 0,
+            }
+        return result
+
+
+# Least-recently-used cache of aggregate results, tagged with the data version they were computed on
+class ResultCache:
+
+    def __init__(self, maxsize=DEFAULT_RESULT_CACHE_SIZE):
+        """
+        :param maxsize: maximum number of results kept, the least recently used one is evicted first
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._results = OrderedDict()  # key -> (data version, result)
+
+    def get(self, key, version):
+        """
+        Looks up a result computed on the given data version.
+
+        :param key: tuple of method name and arguments
+        :param version: the current data version
+        :return: (True, result) on a hit, (False, None) on a miss
+        """
+        entry = self._results.get(key)
+        if entry is not None and entry[0] == version:
+            self._results.move_to_end(key)
+            self.hits += 1
+            return True, entry[1]
+        if entry is not None:
+            del self._results[key]  # computed on older data
+        self.misses += 1
+        return False, None
+
+    def put(self, key, version, result):
+        """
+        Stores a result, evicting the least recently used ones if the cache is full.
+
+        :param key: tuple of method name and arguments
+        :param version: the data version the result was computed on
+        :param result: the result to keep
+        :return: None
+        """
+        self._results[key] = (version, result)
+        self._results.move_to_end(key)
+        while len(self._results) > self.maxsize:
+            self._results.popitem(last=False)
+
+    def clear(self):
+        self._results.clear()
+
+    def info(self):
+        """
+        :return: dictionary with the hit and miss counters and the current and maximum size
+        """
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._results), 'maxsize': self.maxsize}
+
+
+def memoized(method):
+    """
+    Decorator for DataProcessor aggregate methods: results are kept in the processor's result cache,
+    keyed by method name and arguments, until the data version changes. Callers get a copy,
+    so changing a returned dictionary never changes the cached one. None results are not cached.
+    """
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        key = (method.__name__,) + args + tuple(sorted(kwargs.items()))
+        found, result = self.results.get(key, self.data_version)
+        if not found:
+            result = method(self, *args, **kwargs)
+            if result is None:
+                return None
+            self.results.put(key, self.data_version, result)
+        return deepcopy(result)
+    return wrapper
+
+
+# Number of latencies kept per method for the percentiles, beyond that a random sample of them is kept
+STATS_SAMPLE_SIZE = 1024
+STATS_PERCENTILES = (50, 90, 99)
+
+
+def percentile(ordered, share):
+    """
+    Nearest-rank percentile of sorted values.
+
+    :param ordered: values sorted in ascending order
+    :param share: percentile between 0 and 100
+    :return: the value below which the given share of the values falls, 0.0 if there are no values
+    """
+    if not ordered:
+        return 0.0
+    return ordered[max(0, math.ceil(share / 100 * len(ordered)) - 1)]
+
+
+# Call counts, latencies and rows scanned per DataProcessor method, recorded only when instrumentation is on
+class Instrumentation:
+
+    def __init__(self, sample_size=STATS_SAMPLE_SIZE):
+        """
+        :param sample_size: number of latencies kept per method for the percentiles
+        """
+        self.sample_size = sample_size
+        self.records = {}  # method name -> [calls, total seconds, rows scanned, array of latencies]
+        self._local = threading.local()  # records of the methods running on each thread, innermost last
+        self._random = random.Random(0)
+
+    def _active(self):
+        active = getattr(self._local, 'active', None)
+        if active is None:
+            active = self._local.active = []
+        return active
+
+    def start(self, name):
+        """
+        Marks a method as running, so that the rows it scans are counted for it.
+
+        :param name: method name
+        :return: the record to pass to stop
+        """
+        record = self.records.get(name)
+        if record is None:
+            record = self.records[name] = [0, 0.0, 0, array('d')]
+        self._active().append(record)
+        return record
+
+    def stop(self, record, elapsed):
+        """
+        Adds one call and its latency to a method's record.
+
+        :param record: record returned by start
+        :param elapsed: duration of the call in seconds
+        :return: None
+        """
+        self._active().pop()
+        record[0] += 1
+        record[1] += elapsed
+        samples = record[3]
+        # Reservoir sampling keeps the percentiles representative without keeping every latency
+        if len(samples) < self.sample_size:
+            samples.append(elapsed)
+        else:
+            slot = self._random.randrange(record[0])
+            if slot < self.sample_size:
+                samples[slot] = elapsed
+
+    def scanned(self, rows):
+        """
+        Counts rows read by the running methods. An outer method includes the rows scanned by the ones it calls.
+
+        :param rows: number of rows read
+        :return: None
+        """
+        for record in self._active():
+            record[2] += rows
+
+    def stats(self):
+        """
+        :return: dictionary of method name -> calls, total, mean and percentile latencies in ms, and rows scanned
+        """
+        result = {}
+        for name, (calls, total, rows, samples) in self.records.items():
+            ordered = sorted(samples)
+            entry = {'calls': calls, 'total_ms': round(total * 1000, 3),
+                     'mean_ms': round(total * 1000 / calls, 3) if calls else 0.0}
+            for share in STATS_PERCENTILES:
+                entry[f'p{share}_ms'] = round(percentile(ordered, share) * 1000, 3)
+            entry['rows_scanned'] = rows
+            result[name] = entry
+        return result
+
+    def reset(self):
+        self.records.clear()
+
+
+def instrumented(method):
+    """
+    Decorator for DataProcessor methods: when the processor has instrumentation, each call is timed
+    and counted under the method name. Without it the method is called straight away.
+    """
+    name = method.__name__
+
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        instrumentation = self.instrumentation
+        if instrumentation is None:
+            return method(self, *args, **kwargs)
+        record = instrumentation.start(name)
+        start = time.perf_counter()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            instrumentation.stop(record, time.perf_counter() - start)
+    return wrapper
+
+
+# Number of rows per page when query results are shown page by page
+DEFAULT_PAGE_SIZE = 20
+
+
+# Composable filter over the transactions, built with where/between/select and evaluated lazily
+class Query:
+
+    def __init__(self, processor, equal=None, ranges=None, columns=None):
+        """
+        Usually created with DataProcessor.query(). Every method returns a new Query, so a partly built
+        query can be reused.
+
+        :param processor: the DataProcessor to query
+        :param equal: dictionary of column name -> set of accepted values
+        :param ranges: dictionary of column name -> (lowest, highest), both included, None for no limit
+        :param columns: names of the columns in the result rows, or None for all of them
+        """
+        self.processor = processor
+        self.equal = equal or {}
+        self.ranges = ranges or {}
+        self.columns = columns
+        self._positions = None  # (data version, matching positions), computed on first use
+
+    def where(self, **conditions):
+        """
+        Keeps the rows where each column equals the given value. A list, tuple or set of values
+        accepts any of them. Numeric columns are compared by value, so TotalPrice=10, 10.0 and '10.00'
+        are the same; dates are given as 'YYYY-MM-DD' or datetime.date; other columns are compared
+        with the text in the csv file. Rows where a number or date is missing or invalid never match.
+
+        :param conditions: column name -> value, e.g. StoreLocation="Rural"
+        :return: the new Query
+        """
+        equal = dict(self.equal)
+        for name, values in conditions.items():
+            values = values if isinstance(values, (list, tuple, set)) else [values]
+            values = {self._normalize(name, value) for value in values} - {None}
+            equal[name] = equal[name] & values if name in equal else values
+        return Query(self.processor, equal, self.ranges, self.columns)
+
+    @staticmethod
+    def _normalize(name, value):
+        """
+        Converts a where() value to the type the column is stored as.
+
+        :param name: column name
+        :param value: the value given to where()
+        :return: a float for numeric columns, a day ordinal for dates, text otherwise; None if it can't match
+        """
+        if name in FLOAT_COLUMNS or name in INT_COLUMNS:
+            number = normalize_number(value) if isinstance(value, str) else float(value)
+            return number if number is not None and math.isfinite(number) else None
+        if name in DATE_COLUMNS:
+            return (parse_date(value) if isinstance(value, str) else value.toordinal()) or None
+        return str(value)
+
+    def between(self, name, lowest=None, highest=None):
+        """
+        Keeps the rows where a column lies between two values, both included. Dates are given as
+        'YYYY-MM-DD' or datetime.date, numeric columns as numbers, other columns are compared as text.
+        Rows where the value is missing or invalid never match.
+
+        :param name: column name
+        :param lowest: smallest accepted value, or None for no lower limit
+        :param highest: largest accepted value, or None for no upper limit
+        :return: the new Query
+        """
+        if name in DATE_COLUMNS:
+            lowest, highest = to_ordinal(lowest), to_ordinal(highest)
+        elif name in FLOAT_COLUMNS or name in INT_COLUMNS:
+            lowest = None if lowest is None else float(lowest)
+            highest = None if highest is None else float(highest)
+        ranges = dict(self.ranges)
+        ranges[name] = (lowest, highest)
+        return Query(self.processor, self.equal, ranges, self.columns)
+
+    def select(self, *columns):
+        """
+        Chooses the columns of the result rows. Columns missing from the data come back empty.
+
+        :param columns: column names
+        :return: the new Query
+        """
+        return Query(self.processor, self.equal, self.ranges, columns)
+
+    def _rows(self, store, positions):
+        if self.columns is None:
+            return RowView(store, positions)
+        columns = self.columns
+        return ({name: store.value(name, position) if name in store else '' for name in columns}
+                for position in positions)
+
+    def positions(self):
+        """
+        Finds the matching row positions in the loaded data. They are kept until the data changes.
+
+        :return: sequence of row positions in load order
+        """
+        processor = self.processor
+        if processor.streaming:
+            raise ValueError("Row positions are only available when the data is loaded, not streamed")
+        if self._positions is None or self._positions[0] != processor.data_version:
+            self._positions = (processor.data_version,
+                               processor._positions_matching(self.equal, self.ranges, processor.store))
+        return self._positions[1]
+
+    def __iter__(self):
+        """
+        Yields the matching rows one at a time; a row dictionary is only built when it is reached.
+        In streaming mode the file is read again chunk by chunk.
+        """
+        if not self.processor.streaming:
+            yield from self._rows(self.processor.store, self.positions())
+            return
+        for store in self.processor._stores():
+            yield from self._rows(store, self.processor._positions_matching(self.equal, self.ranges, store))
+
+    def count(self):
+        """
+        :return: number of matching rows, without building any of them
+        """
+        if not self.processor.streaming:
+            return len(self.positions())
+        return sum(len(self.processor._positions_matching(self.equal, self.ranges, store))
+                   for store in self.processor._stores())
+
+    def first(self):
+        """
+        :return: the first matching row, or None if no row matches
+        """
+        return next(iter(self), None)
+
+    def page(self, number, size=DEFAULT_PAGE_SIZE):
+        """
+        Returns one page of the matching rows.
+
+        :param number: page number, starting at 0
+        :param size: rows per page
+        :return: list of row dictionaries, empty past the last page
+        """
+        if not self.processor.streaming:
+            return list(self._rows(self.processor.store, self.positions()[number * size:(number + 1) * size]))
+        return list(islice(self, number * size, (number + 1) * size))
+
+    def pages(self, size=DEFAULT_PAGE_SIZE):
+        """
+        Yields the matching rows in pages, reading the data only once.
+
+        :param size: rows per page
+        :return: generator of lists of row dictionaries
+        """
+        rows = iter(self)
+        while True:
+            page = list(islice(rows, size))
+            if not page:
+                return
+            yield page
+
 
 # Process data from csv file
 class DataProcessor:
 
-    def __init__(self, file_path):
+    def __init__(self, file_path, streaming=False, chunk_size=DEFAULT_CHUNK_SIZE, workers=1, cache=False,
+                 cache_dir=None, result_cache_size=DEFAULT_RESULT_CACHE_SIZE, instrument=False, summarise_by=()):
         """
         Initializes the DataProcessor with data loaded from a CSV file.
 
         :param file_path:path to the csv file we are working with
+        :param streaming: if True, read the file in chunks and keep only running totals instead of the rows,
+                          so memory use depends on chunk_size rather than on the size of the file
+        :param chunk_size: number of rows read at a time in streaming mode
+        :param workers: number of processes that read the file in parallel, only in streaming mode,
+                        where each process returns small running totals. Loaded data is always parsed
+                        in this process
+        :param cache: if True, keep the parsed columns in a binary cache file and reuse them
+                      on the next start as long as the csv file hasn't changed
+        :param cache_dir: folder for the cache file, by default it is written next to the csv file
+        :param result_cache_size: number of aggregate results kept in memory between calls
+        :param instrument: if True, record call counts, latencies and rows scanned per method, see stats
+        :param summarise_by: in streaming mode, more columns to total while the file is read, e.g. ('ProductCategory',),
+                             so that summaries_by answers for them without reading the file again
+        :raises ValueError: if workers is more than 1 without streaming
         """
-        self.data = [] # store all data from the csv file
-        self.load_data(file_path)
+        if workers > 1 and not streaming:
+            raise ValueError("workers > 1 needs streaming=True, loaded data is parsed in a single process")
+        self.file_path = file_path
+        self.streaming = streaming
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.cache = cache
+        self.cache_dir = cache_dir
+        self.summarise_by = tuple(summarise_by)
+        self.store = ColumnStore([])  # store all data from the csv file, column by column
+        self.totals = None  # running totals, built on first use or while streaming
+        self.cube = None  # date rollup cube, built on first use
+        self.data_version = 0  # bumped whenever the data changes, invalidates cached results
+        self.results = ResultCache(result_cache_size)
+        self.instrumentation = Instrumentation() if instrument else None
+        # Set from another thread to stop the running query, which then raises QueryCancelled.
+        # Loading and appending never check it, so the data is never left half changed
+        self.cancel_requested = threading.Event()
+        if streaming:
+            self.stream_data(file_path)
+        else:
+            self.load_data(file_path)
+
+    @property
+    def data(self):
+        """
+        All transactions as a read-only sequence of csv-style dictionaries, in both modes.
+        Rows are built on access, not kept in memory. In streaming mode every iteration or index
+        reads the file again, so processor.data[i] in a loop is slow there: iterate instead.
+        """
+        if self.streaming:
+            return StreamedRows(self)
+        return RowView(self.store)
 
 
 # Load the data from csv file
+    @instrumented
     def load_data(self, file_path):
         """
         Loads data from specified csv file.
@@ -22,35 +1670,286 @@ class DataProcessor:
         :param file_path: Path to the CSV file into data.
         :return: None
         """
+        self.data_version += 1
+        self.totals = None
+        self.cube = None
+        # Reuse the columns parsed by an earlier run if the file hasn't changed since
+        if self.cache:
+            key = fingerprint(file_path)
+            cache_path = cache_path_for(file_path, self.cache_dir)
+            store = read_cache(cache_path, key)
+            if store is not None:
+                self.store = store
+                return
+
         with open(file_path, mode='r', encoding='utf-8') as file:
             reader = csv.DictReader(file)
-            self.data = list(reader) # store all rows in a list
+            store = ColumnStore(reader.fieldnames or [])
+            # Parse the rows in batches so that every column is converted with one call per batch
+            while True:
+                rows = list(islice(reader, self.chunk_size))
+                if not rows:
+                    break
+                store.extend(rows)
+                self._scanned(len(rows))
+        self.store = store
+
+        if self.cache:
+            try:
+                write_cache(store, cache_path, key)
+            except OSError as error:
+                print(f"Could not write the cache file {cache_path}: {error}")
+
+# Stream the data from csv file
+    @instrumented
+    def stream_data(self, file_path):
+        """
+        Reads the specified csv file chunk by chunk and keeps only the running totals
+        needed for the summaries, revenue by location and the unique values.
+
+        :param file_path: Path to the CSV file.
+        :return: None
+        """
+        self.data_version += 1
+        self.cube = None
+        totals = StreamingAggregator(self.summarise_by)
+        if self.workers > 1:
+            # Each worker aggregates one shard of the file, the shard totals are merged in file order.
+            # The process pool is only imported here, multiprocessing adds noticeably to the start-up time
+            from concurrent.futures import ProcessPoolExecutor
+            shards = split_shards(file_path, self.workers)
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                for partial in pool.map(aggregate_shard, [file_path] * len(shards),
+                                        [begin for begin, _ in shards], [end for _, end in shards],
+                                        [self.chunk_size] * len(shards), [self.summarise_by] * len(shards)):
+                    totals.merge(partial)
+            if not shards:
+                with open(file_path, mode='r', encoding='utf-8') as file:
+                    totals.fieldnames = csv.DictReader(file).fieldnames or []
+        else:
+            for chunk in read_chunks(file_path, self.chunk_size):
+                totals.update(chunk)
+        self._scanned(totals.rows)
+        self.totals = totals
+
+# Add new transactions without reloading the file
+    @instrumented
+    def append_rows(self, rows):
+        """
+        Adds new transactions to the loaded data. The indexes, the date rollup cube and the running totals
+        behind group_by_location and sales_summary are updated in place instead of being recomputed.
+        The whole batch is rejected if a TransactionID is already present or repeated in it.
+
+        :param rows: iterable of csv-style dictionaries with the same columns as the file
+        :return: number of rows added
+        """
+        if self.streaming:
+            raise ValueError("Rows can only be appended when the data is loaded, not streamed")
+        rows = list(rows)
+        # Check every ID before changing anything, so a rejected batch leaves the data as it was
+        if PRIMARY_KEY in self.store:
+            new_ids = set()
+            for row in rows:
+                transaction_id = row.get(PRIMARY_KEY) or ''
+                if transaction_id in new_ids or self.store.find(transaction_id) is not None:
+                    raise ValueError(f"Duplicate TransactionID: {transaction_id}")
+                new_ids.add(transaction_id)
+
+        self._scanned(len(rows))
+        first = len(self.store)
+        # One batch, so every column is converted and every index updated once for all the rows
+        self.store.extend(rows)
+        if self.totals is not None:
+            self.totals.update(self.store, range(first, len(self.store)))
+        if self.cube is not None:
+            self.cube.update(self.store, range(first, len(self.store)))
+        self.data_version += 1
+        return len(rows)
+
+    def append_csv(self, file_path):
+        """
+        Adds the transactions of another csv file to the loaded data, see append_rows.
+
+        :param file_path: Path to a CSV file with the same columns.
+        :return: number of rows added
+        """
+        with open(file_path, mode='r', encoding='utf-8') as file:
+            return self.append_rows(csv.DictReader(file))
 
 # Counts the total amount of transactions
+    @instrumented
     def get_total_transactions(self):
         """
         Counts the total number of transactions.
 
         :return: total number of transactions
         """
-        return len(self.data)
+        if self.streaming:
+            return self.totals.rows
+        return len(self.store)
 
 
 # Showing the list of possible locations and possible product categories
+    @instrumented
     def get_unique_locations_and_categories(self):
         """
         Retrieves unique store locations and product categories from the data.
 
         :return: two lists, one with unique locations, second one with unique product categories.
         """
-        locations = set()
-        categories = set()
-        for transaction in self.data:
-            locations.add(transaction['StoreLocation'])
-            categories.add(transaction['ProductCategory'])
-        return list(locations), list(categories)
+        if self.streaming:
+            return list(self.totals.locations), list(self.totals.categories)
+        locations = list(self.store.categories.get('StoreLocation', []))
+        categories = list(self.store.categories.get('ProductCategory', []))
+        return locations, categories
+
+# Read the parsed values of a numeric column, e.g. for a histogram
+    @instrumented
+    def get_column_values(self, name):
+        """
+        Retrieves the valid values of a numeric column, leaving out the ones that weren't numbers.
+
+        :param name: name of a numeric column such as 'TotalPrice'
+        :return: typed array of the values in file order, it can be handed to NumPy without copying
+        """
+        stores = self._stores()
+        values = array('q' if name in INT_COLUMNS else 'd')
+        for store in stores:
+            if name not in store:
+                continue
+            self._scanned(len(store))
+            valid = store.valid_values(name)
+            if isinstance(valid, list):
+                values.extend(valid)
+            else:
+                values.frombytes(valid.tobytes())  # a column without invalid values is copied as one block
+        return values
+
+    def _stores(self):
+        """
+        Returns the data as ColumnStores: the loaded store, or the file read again chunk by chunk in streaming mode.
+
+        :return: iterable of ColumnStore
+        """
+        if self.streaming:
+            return self._until_cancelled(read_chunks(self.file_path, self.chunk_size))
+        return [self.store]
+
+    def _until_cancelled(self, chunks):
+        # Passes the chunks on, stopping between two of them if the query is cancelled
+        for chunk in chunks:
+            check_cancelled(self.cancel_requested)
+            yield chunk
+
+    @instrumented
+    def _positions_where(self, name, value, store=None):
+        """
+        Finds the row positions where a column equals the given value.
+        For TransactionID only the first matching row is returned.
+
+        :param name: column name
+        :param value: string value to compare against
+        :param store: the ColumnStore to search, by default the loaded data
+        :return: sequence of row positions
+        """
+        store = self.store if store is None else store
+        if name not in store:
+            return []
+        # Use the hash indexes where there is one, otherwise scan the column
+        if name == PRIMARY_KEY:
+            position = store.find(value)
+            return [] if position is None else [position]
+        if name in CATEGORY_COLUMNS:
+            positions = store.positions(name, value)
+            self._scanned(len(positions))
+            return positions
+        column = store.columns[name]
+        self._scanned(len(column))
+        return [position for position in range(len(column)) if store.value(name, position) == value]
+
+    @instrumented
+    def _positions_matching(self, equal, ranges, store):
+        """
+        Finds the row positions that meet every condition of a query. The hash indexes narrow the rows
+        down first, starting with the condition that matches the fewest rows; the remaining conditions
+        are then checked on the typed columns of those rows only.
+
+        :param equal: dictionary of column name -> set of accepted values, already converted by Query._normalize
+        :param ranges: dictionary of column name -> (lowest, highest), already converted to the stored type
+        :param store: the ColumnStore to search
+        :return: list of row positions in load order
+        """
+        if any(name not in store for name in list(equal) + list(ranges)):
+            return []
+        # Candidate positions from the indexes, one sorted sequence per indexed condition
+        indexed = []
+        for name, values in equal.items():
+            if name == PRIMARY_KEY:
+                indexed.append((name, sorted({position for position in map(store.find, values)
+                                              if position is not None})))
+            elif name in CATEGORY_COLUMNS:
+                postings = [store.positions(name, value) for value in values]
+                indexed.append((name, postings[0] if len(postings) == 1 else sorted(chain(*postings))))
+        if indexed:
+            driver, candidates = min(indexed, key=lambda item: len(item[1]))
+        else:
+            driver, candidates = None, range(len(store))
+        self._scanned(len(candidates))
+
+        matched = candidates
+        for name, values in equal.items():
+            if name == driver:
+                continue
+            column = store.columns[name]
+            if name in CATEGORY_COLUMNS:
+                codes = {store.code_of(name, value) for value in values} - {None}
+                matched = [position for position in matched if column[position] in codes]
+            elif name == PRIMARY_KEY:
+                matched = [position for position in matched if column[position] in values]
+            elif name in store.nulls:
+                # Invalid numbers are stored as NaN or 0, so the null mask decides before the value does
+                mask = store.nulls[name] if store.null_counts[name] else None
+                matched = [position for position in matched
+                           if column[position] in values and not (mask is not None and mask[position])]
+            elif name in DATE_COLUMNS:
+                # Missing dates are stored as 0, which _normalize never returns
+                matched = [position for position in matched if column[position] in values]
+            else:
+                matched = [position for position in matched if store.value(name, position) in values]
+        for name, (lowest, highest) in ranges.items():
+            column = store.columns[name]
+            if name in CATEGORY_COLUMNS:
+                # Compare the distinct values once and keep the rows whose code is in range
+                codes = {code for code, value in enumerate(store.categories[name])
+                         if (lowest is None or value >= lowest) and (highest is None or value <= highest)}
+                matched = [position for position in matched if column[position] in codes]
+                continue
+            if name in DATE_COLUMNS:
+                # Missing dates are stored as 0, which is below every real date
+                lowest = lowest or 1
+            if lowest is not None:
+                matched = [position for position in matched if column[position] >= lowest]
+            if highest is not None:
+                matched = [position for position in matched if column[position] <= highest]
+            if store.null_counts.get(name):
+                mask = store.nulls[name]
+                matched = [position for position in matched if not mask[position]]
+        return list(matched)
+
+    def _rows_where(self, name, value):
+        """
+        Yields the rows where a column equals the given value, reading the file again in streaming mode.
+
+        :param name: column name
+        :param value: string value to compare against
+        :return: generator of csv-style row dictionaries
+        """
+        stores = self._stores()
+        for store in stores:
+            yield from RowView(store, self._positions_where(name, value, store))
 
 # Retrieve details of a specific transaction using the TransactionID
+    @instrumented
     def get_transaction_details(self, transaction_id):
         """
         Show details of a specific transaction by ID
@@ -58,26 +1957,35 @@ class DataProcessor:
         :param transaction_id: the ID of transaction to show the information about
         :return: details about specified transaction, or None if not found
         """
-        for transaction in self.data:
-            if transaction['TransactionID'] == transaction_id:
-                return transaction
-        return None
+        return next(self._rows_where('TransactionID', transaction_id), None)
 
 # Retrieve all transactions for a specific store location
+    @instrumented
     def get_transactions_by_location(self, location):
         """Retrieves all transactions for a specific store location."""
-        return [transaction for transaction in self.data if transaction.get('StoreLocation') == location]
+        return list(self._rows_where('StoreLocation', location))
 
+    @instrumented
     def get_transactions_by_category(self, category):
         """Retrieves all transactions for a specific product category."""
-        result = [transaction for transaction in self.data if transaction.get('ProductCategory') == category]
+        result = list(self._rows_where('ProductCategory', category))
         if not result:
             print(f"No transactions found for category: {category}")
-        else:
-            for transaction in result:
-                print(transaction)
         return result
 
+# Filter the transactions on several columns at once
+    def query(self):
+        """
+        Starts a query over all transactions, e.g.
+        processor.query().where(StoreLocation="Rural", PaymentMethod="Cash").between("TransactionDate", a, b)
+        Rows are only looked up when the query is iterated, counted or paged.
+
+        :return: Query matching every row
+        """
+        return Query(self)
+
+    @instrumented
+    @memoized
     def group_by_location(self):
         """
         Groups transactions by store location and calculates total revenue for each location.
@@ -85,19 +1993,13 @@ class DataProcessor:
 
         :return: a dictionary with store locations as keys and total revenue as values.
         """
-        self.revenue_by_location = defaultdict(float)
+        self.revenue_by_location = {}
 
-        # Iterate through each transaction in the dataset
-        for transaction in self.data:
-            # Check if both 'StoreLocation' and 'TotalPrice' are present in the transaction
-            if 'StoreLocation' in transaction and 'TotalPrice' in transaction:
-                store_location = transaction['StoreLocation']
-                total_price_str = transaction['TotalPrice'].strip()
-                # Convert total price to a float
-                total_price = float(total_price_str.replace(',', '.')) if total_price_str.replace(',', '').replace('.',
-                                                                                                                   '',
-                                                                                                                   1).isdigit() else 0.0
-                self.revenue_by_location[store_location] += total_price
+        # Both columns are needed to attribute revenue to a location
+        totals = self._running_totals()
+        if 'StoreLocation' in totals.fieldnames and 'TotalPrice' in totals.fieldnames:
+            self.revenue_by_location = {location: group.sum('TotalPrice')
+                                        for location, group in totals.locations.items()}
 
         # Format the revenue values and store them as an attribute
         self.revenue_by_location = {location: round(revenue, 2) for location, revenue in
@@ -106,57 +2008,219 @@ class DataProcessor:
         # Return the dictionary
         return self.revenue_by_location
 
+    @instrumented
+    def _running_totals(self):
+        """
+        Returns the per-location running totals, computing them in one pass over the loaded data
+        the first time. Appended rows are added to them in place.
+
+        :return: StreamingAggregator for all the data
+        """
+        if self.totals is None:
+            totals = StreamingAggregator()
+            totals.update(self.store, cancelled=self.cancel_requested)
+            self._scanned(len(self.store))
+            self.totals = totals
+        return self.totals
+
 #  Provide a summary of sales for a specific store location
+    @instrumented
+    @memoized
     def sales_summary(self, location):
         """
         Generates a sales summary for a specific store location.
         :param location: consist of multiple calculations to fill all the requested information for sales summary
         :return: sales summary including total transactions, total revenue, average transaction value, total quantity sold, average customer satisfaction and payment method percentage
         """
-        # Show transactions specific to the provided location
-        location_data = self.get_transactions_by_location(location)
+        # The running totals already hold every figure of the summary for each location
+        group = self._running_totals().locations.get(location)
         # Check if there are any transactions for the given location
-        if not location:
+        if group is None:
             print(f"No transactions found for location: {location}")
-        return None
+            return None
+        return format_summary(group)
 
-    # Calculate total number of transactions
-    total_transactions = len(location_data)
-    # Set total revenue to zero
-    total_revenue = 0
-    # Use for oop to go through each transaction to calculate total revenue
-    for transaction in location_data:
-        if 'TotalPrice' in transaction: # Ensure the 'TotalPrice' field exists
-            # Remove currency symbols and format the price for calculation
-            value = transaction['TotalPrice'].replace('£', '').replace(',', '').strip()
-            if value.replace('.', '', 1).isdigit(): # Check if the value is numeric
-                total_revenue += float(value)
-    # Calculate average transaction value
-    average_transaction_value = total_revenue / total_transactions if total_transactions > 0 else 0
-    # Calculate total quantity sold by summing the 'Quantity' field
-    total_quantity = sum(int(transaction['Quantity']) for transaction in location_data if
-                         'Quantity' in transaction and transaction['Quantity'])
-    # Calculate average customer satisfaction
-    average_satisfaction = (
-        sum(float(transaction['CustomerSatisfaction']) for transaction in location_data if
-            'CustomerSatisfaction' in transaction and transaction['CustomerSatisfaction']) / total_transactions
-        if total_transactions > 0 else 0
-    )
-    # Count payment methods
-    payment_method_count = defaultdict(int)
-    for transaction in location_data:
-        payment_method_count[transaction['PaymentMethod']] += 1
-    # Calculate the percentage of each payment method
-    payment_method_percentage = [
-        f"{method}: {(count / total_transactions) * 100:.2f}%"
-        for method, count in payment_method_count.items()
-    ]
-    # Return the sales summary as a dictionary
-    return {
-        "Total Transactions": total_transactions,
-        "Total Revenue": format(total_revenue, '.2f'),
-        "Average Transaction Value": format(average_transaction_value, '.2f'),
-        "Total Quantity Sold": total_quantity,
-        "Average Customer Satisfaction": format(average_satisfaction,'.2f'),
-        "Payment Method Percentage": ', '.join(payment_method_percentage)
-    }
\ No newline at end of file
+#  Provide sales summaries for every store location at once
+    @instrumented
+    @memoized
+    def sales_summaries(self):
+        """
+        Generates the sales summary of every store location in a single pass over the data.
+
+        :return: dictionary of store location -> sales summary, as returned by sales_summary
+        """
+        return {location: format_summary(group) for location, group in self._running_totals().locations.items()}
+
+#  Provide sales summaries for every value of several columns at once
+    @instrumented
+    @memoized
+    def summaries_by(self, *columns):
+        """
+        Generates sales summaries for every value of each given column, e.g. every store location and every
+        product category, from a single pass over the data. The pass aggregates every combination of values,
+        and the summaries of each column are then added up from those combinations.
+
+        :param columns: names of the columns to summarise by, columns missing from the data are left empty
+        :return: dictionary of column name -> {value: sales summary}
+        """
+        # A streamed file may already have the totals of these columns, see summarise_by
+        if self.streaming and self.totals is not None:
+            groups = self.totals.summaries(columns)
+            if groups is not None:
+                return {name: {value: format_summary(group) for value, group in values.items()}
+                        for name, values in groups.items()}
+        stores = self._stores()
+        combinations = {}
+        present = ()
+        for store in stores:
+            present = tuple(name for name in columns if name in store)
+            if not present:
+                continue
+            self._scanned(len(store))
+            for key, group in aggregate(store, present, cancelled=self.cancel_requested).items():
+                if key in combinations:
+                    combinations[key].merge(group)
+                else:
+                    combinations[key] = group
+
+        groups = {name: {} for name in columns}
+        for key, group in combinations.items():
+            for name, value in zip(present, key):
+                total = groups[name].get(value)
+                if total is None:
+                    total = groups[name][value] = GroupAggregate(group.numeric, group.counted)
+                total.merge(group)
+        return {name: {value: format_summary(group) for value, group in values.items()}
+                for name, values in groups.items()}
+
+# Show how well the result cache is working
+    def cache_info(self):
+        """
+        Reports the hit and miss counters of the aggregate result cache.
+
+        :return: dictionary with hits, misses, size and maxsize
+        """
+        return self.results.info()
+
+    def clear_caches(self):
+        """
+        Drops everything derived from the data: cached results, indexes, running totals and the rollup cube.
+        They are rebuilt on first use, e.g. to time a query from a cold start.
+        In streaming mode the running totals are kept, because they are the only copy of the data.
+
+        :return: None
+        """
+        self.results.clear()
+        self.store.drop_indexes()
+        self.cube = None
+        if not self.streaming:
+            self.totals = None
+
+# Report where the time goes, when instrumentation is on
+    def stats(self):
+        """
+        Reports the call counts, latencies and rows scanned of every instrumented method called so far.
+        Calls answered from the result cache are counted too, so they show up as fast calls without rows.
+
+        :return: dictionary of method name -> calls, total_ms, mean_ms, p50_ms, p90_ms, p99_ms and rows_scanned,
+                 empty if the processor was created without instrumentation
+        """
+        if self.instrumentation is None:
+            return {}
+        return self.instrumentation.stats()
+
+    def reset_stats(self):
+        if self.instrumentation is not None:
+            self.instrumentation.reset()
+
+    def _scanned(self, rows):
+        # Count rows read for the methods running right now, only when instrumentation is on
+        if self.instrumentation is not None:
+            self.instrumentation.scanned(rows)
+
+    def profile(self, name, *args, memory=False, limit=20, **kwargs):
+        """
+        Runs one method under cProfile, and optionally tracemalloc, to see which functions the time
+        and memory go to. Cached results are returned as usual, call clear_caches first to profile a cold call.
+
+        :param name: name of the method to run, e.g. 'sales_summary'
+        :param args: arguments for the method
+        :param memory: if True, also trace memory allocations and report the peak and the largest ones
+        :param limit: number of functions and allocation sites in the report
+        :param kwargs: keyword arguments for the method
+        :return: (result of the method, text report)
+        """
+        # The profilers are only imported when they are used
+        import cProfile
+        import pstats
+        import tracemalloc
+
+        method = getattr(self, name)
+        profiler = cProfile.Profile()
+        # Leave tracemalloc running if someone else started it, e.g. the benchmark suite
+        tracing = memory and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        try:
+            result = profiler.runcall(method, *args, **kwargs)
+            if memory:
+                snapshot = tracemalloc.take_snapshot()
+                peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            if tracing:
+                tracemalloc.stop()
+
+        report = io.StringIO()
+        pstats.Stats(profiler, stream=report).sort_stats('cumulative').print_stats(limit)
+        if memory:
+            report.write(f"Peak traced memory: {peak / 2 ** 20:.2f} MiB\n")
+            for statistic in snapshot.statistics('lineno')[:limit]:
+                report.write(f"{statistic}\n")
+        return result, report.getvalue()
+
+    @instrumented
+    def _rollup_cube(self):
+        """
+        Returns the date rollup cube, building it in one pass over the data the first time.
+
+        :return: RollupCube for all the data
+        """
+        if self.cube is None:
+            cube = RollupCube()
+            stores = self._stores()
+            for store in stores:
+                cube.update(store, cancelled=self.cancel_requested)
+                self._scanned(len(store))
+            self.cube = cube
+        return self.cube
+
+# Summarise the sales of a date range from the rollup cube
+    @instrumented
+    @memoized
+    def date_range_summary(self, start=None, end=None, by='StoreLocation'):
+        """
+        Sums the transactions between two dates (both included) for each value of a column.
+
+        :param start: first day, as 'YYYY-MM-DD', or None for the earliest one
+        :param end: last day, as 'YYYY-MM-DD', or None for the latest one
+        :param by: 'StoreLocation', 'ProductCategory' or 'PaymentMethod'
+        :return: dictionary of value -> total transactions, revenue, quantity and average satisfaction
+        """
+        return self._rollup_cube().query(start, end, by=(by,))
+
+# Revenue per day, month or year
+    @instrumented
+    @memoized
+    def revenue_trend(self, bucket='day', start=None, end=None, location=None):
+        """
+        Calculates the revenue of every day, month or year in a date range.
+
+        :param bucket: 'day', 'month' or 'year'
+        :param start: first day, as 'YYYY-MM-DD', or None for the earliest one
+        :param end: last day, as 'YYYY-MM-DD', or None for the latest one
+        :param location: only count this store location, or None for all of them
+        :return: dictionary of bucket label -> revenue, in date order
+        """
+        where = {'StoreLocation': location} if location is not None else None
+        totals = self._rollup_cube().query(start, end, by=(), bucket=bucket, where=where)
+        return {label: total["Total Revenue"] for label, total in totals.items()}
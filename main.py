@@ -1,11 +1,25 @@
-from data_processor_my import DataProcessor
-from visualizer import Visualizer
+from data_processor import DataProcessor
 import json
+import sys
+
+
+# Print the rows of a query one page at a time, asking before each next page
+def show_pages(query, empty_message):
+    shown = 0
+    for page in query.pages():
+        if shown and input("Press Enter for more, or q to stop: ").strip().lower() == 'q':
+            return
+        for transaction in page:
+            print(transaction)
+        shown += len(page)
+    print(f"{shown} transaction(s) shown." if shown else empty_message)
 
 # Ask user to input the path to the CSV file
 def main():
+    # Queries are only timed for option 12 when asked for with: python main.py --stats
+    instrument = '--stats' in sys.argv[1:]
     file_path = input("Enter the path to the CSV file: ")
-    processor = DataProcessor(file_path)
+    processor = DataProcessor(file_path, cache=True, instrument=instrument)
 
     while True:
         # Display a menu of options to the user
@@ -20,7 +34,9 @@ def main():
         print("8. Visualize Data")
         print("9. Interactive Dashboard")
         print("10. Export Sales Summary to JSON")
-        print("11. Exit")
+        print("11. Sales Summary by Date Range")
+        print("12. Performance Statistics")
+        print("13. Exit")
 
         # User should make the choice what information they want to receive
         choice = input("Select an option: ")
@@ -41,15 +57,11 @@ def main():
         # Display all transactions for a specific store location
         elif choice == '4':
             location = input("Enter Store Location: ")
-            transactions = processor.get_transactions_by_location(location)
-            for transaction in transactions:
-                print(transaction)
+            show_pages(processor.query().where(StoreLocation=location), "No transactions found for this location.")
         # Display all transactions for a specific product category
         elif choice == '5':
             category = input("Enter Product Category: ")
-            transactions = processor.get_transactions_by_category(category)
-            for transaction in transactions:
-                print(transaction)
+            show_pages(processor.query().where(ProductCategory=category), "No transactions found for this category.")
         # Display total revenue by store location
         elif choice == '6':
             revenue_data = processor.group_by_location()
@@ -65,10 +77,13 @@ def main():
                 print("No transactions found for this location.")
         # Visualize revenue by store location using a pie chart
         elif choice == '8':
+            # The plotting libraries are only loaded when a chart is asked for, which keeps the menu fast to start
+            from visualizer import Visualizer
             location_revenue = processor.group_by_location()
             Visualizer.pie_chart(location_revenue, "Revenue by Store Location")
         # Show interactive dashboard
         elif choice == '9':
+            from visualizer import Visualizer
             Visualizer.interactive_dashboard(processor)
         # Export a sales summary for a specific location to a JSON file
         elif choice == '10':
@@ -80,8 +95,37 @@ def main():
                 print(f"Sales summary exported to {location}_sales_summary.json")
             else:
                 print("No transactions found for this location.")
-        # Exit the program
+        # Display totals for each store location between two dates
         elif choice == '11':
+            start = input("Enter start date (YYYY-MM-DD, leave empty for the first day): ").strip() or None
+            end = input("Enter end date (YYYY-MM-DD, leave empty for the last day): ").strip() or None
+            try:
+                summary = processor.date_range_summary(start, end)
+            except ValueError:
+                print("Invalid date. Please use the YYYY-MM-DD format.")
+                continue
+            if summary:
+                for location, totals in summary.items():
+                    print(f"\n{location}")
+                    for key, value in totals.items():
+                        print(f"{key}:{value}")
+            else:
+                print("No transactions found for this date range.")
+        # Display how often each query ran, how long it took and how many rows it read
+        elif choice == '12':
+            if not instrument:
+                print("Performance statistics are off, start the program with: python main.py --stats")
+                continue
+            stats = processor.stats()
+            print(f"{'Method':<30}{'Calls':>7}{'Total ms':>11}{'Mean ms':>10}{'p50 ms':>10}{'p90 ms':>10}"
+                  f"{'p99 ms':>10}{'Rows':>10}")
+            for name, entry in sorted(stats.items(), key=lambda item: -item[1]['total_ms']):
+                print(f"{name:<30}{entry['calls']:>7}{entry['total_ms']:>11.3f}{entry['mean_ms']:>10.3f}"
+                      f"{entry['p50_ms']:>10.3f}{entry['p90_ms']:>10.3f}{entry['p99_ms']:>10.3f}"
+                      f"{entry['rows_scanned']:>10}")
+            print("Result cache:", processor.cache_info())
+        # Exit the program
+        elif choice == '13':
             break
         else:
             print("Invalid option. Please try again.")
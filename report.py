@@ -0,0 +1,171 @@
+import argparse
+import json
+import os
+import time
+from datetime import datetime
+
+from data_processor import DEFAULT_CHUNK_SIZE, DataProcessor
+
+
+# Measures how long each stage of the report takes
+class StageTimer:
+
+    def __init__(self):
+        self.timings = {}  # stage name -> seconds, in the order the stages ran
+        self._stage = None
+        self._start = None
+
+    def start(self, stage):
+        """
+        Ends the running stage, if any, and starts timing the next one.
+
+        :param stage: name of the stage
+        :return: None
+        """
+        self.stop()
+        self._stage = stage
+        self._start = time.perf_counter()
+
+    def stop(self):
+        if self._stage is not None:
+            elapsed = time.perf_counter() - self._start
+            self.timings[self._stage] = round(elapsed, 3)
+            print(f"{self._stage}: {elapsed:.3f} s")
+            self._stage = None
+
+
+def build_report(processor, categories):
+    """
+    Computes the summaries of every store location, and optionally every product category, in one pass.
+
+    :param processor: DataProcessor with the data loaded or streamed
+    :param categories: if True, include the product category summaries
+    :return: dictionary with the summaries per location and per category
+    """
+    if categories:
+        summaries = processor.summaries_by('StoreLocation', 'ProductCategory')
+        return {"locations": summaries['StoreLocation'], "categories": summaries['ProductCategory']}
+    return {"locations": processor.sales_summaries()}
+
+
+def write_report(report, source, output, output_format):
+    """
+    Writes the summaries in the chosen format.
+
+    :param report: dictionary returned by build_report
+    :param source: path of the csv file the report was made from
+    :param output: file to write for 'json' and 'ndjson', folder to write into for 'files'
+    :param output_format: 'json' for one document, 'ndjson' for one line per summary,
+                          'files' for one json file per location (and category)
+    :return: list of the files written
+    """
+    if output_format == 'files':
+        os.makedirs(output, exist_ok=True)
+        written = []
+        for group, suffix in (("locations", "sales_summary"), ("categories", "category_summary")):
+            for value, summary in report.get(group, {}).items():
+                path = os.path.join(output, f"{value}_{suffix}.json")
+                with open(path, "w") as json_file:
+                    json.dump(summary, json_file, indent=4)
+                written.append(path)
+        return written
+
+    with open(output, "w") as report_file:
+        if output_format == 'ndjson':
+            for group, column in (("locations", "StoreLocation"), ("categories", "ProductCategory")):
+                for value, summary in report.get(group, {}).items():
+                    report_file.write(json.dumps({"group": column, "value": value, **summary}) + "\n")
+        else:
+            json.dump({"source": source, "generated": datetime.now().isoformat(timespec='seconds'), **report},
+                      report_file, indent=4)
+    return [output]
+
+
+def prepare_output(output, output_format):
+    """
+    Creates the folder the report goes into, before any work is done, so that a bad path fails straight away.
+
+    :param output: file to write for 'json' and 'ndjson', folder to write into for 'files'
+    :param output_format: 'json', 'ndjson' or 'files'
+    :return: None
+    """
+    folder = output if output_format == 'files' else os.path.dirname(output)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+
+
+def render_charts(processor, folder):
+    """
+    Saves the revenue pie chart and the transaction value histogram as PNG files, without a display.
+    The charts are drawn by the visualizer, so they match the ones of the menu and the dashboard.
+
+    :param processor: DataProcessor with the data loaded or streamed
+    :param folder: folder to write the images into
+    :return: list of the files written
+    """
+    # The plotting stack is only imported when charts are asked for; Agg draws straight to image files
+    import visualizer
+    visualizer.load_pyplot('Agg')
+
+    os.makedirs(folder, exist_ok=True)
+    pie_path = os.path.join(folder, "revenue_by_location.png")
+    visualizer.write_figure(visualizer.pie_chart_figure(processor.group_by_location(), "Revenue by Store Location"),
+                            pie_path)
+
+    histogram_path = os.path.join(folder, "transaction_values.png")
+    # The values are counted per bin once, only the bins are drawn
+    counts, edges = visualizer.histogram_bins(processor.get_column_values('TotalPrice'))
+    visualizer.write_figure(visualizer.histogram_figure(counts, edges, "Histogram of Total Transaction Values"),
+                            histogram_path)
+    return [pie_path, histogram_path]
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Export the sales summaries of every store location without any prompts, e.g. from cron.")
+    parser.add_argument("csv_file", help="path to the retail sales csv file")
+    parser.add_argument("-o", "--output", default="sales_report.json",
+                        help="report file, or folder when --format is 'files' (default: sales_report.json)")
+    parser.add_argument("-f", "--format", choices=("json", "ndjson", "files"), default="json",
+                        help="one json document, one json line per summary, or one file per location")
+    parser.add_argument("--categories", action="store_true", help="also summarise every product category")
+    parser.add_argument("--charts", metavar="FOLDER", help="also save the charts as PNG files in this folder")
+    parser.add_argument("--streaming", action="store_true",
+                        help="read the file in chunks instead of loading it, for files larger than memory")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="rows per chunk")
+    parser.add_argument("--cache", action="store_true", help="reuse the binary cache of the parsed csv file")
+    return parser, parser.parse_args(argv)
+
+
+def main(argv=None):
+    parser, args = parse_arguments(argv)
+    if not os.path.isfile(args.csv_file):
+        parser.error(f"file not found: {args.csv_file}")
+
+    try:
+        prepare_output(args.output, args.format)
+    except OSError as error:
+        parser.error(f"can't write to {args.output}: {error}")
+
+    timer = StageTimer()
+    timer.start("load")
+    # A streamed file is read once, so the category totals are collected in the same pass as the location ones
+    processor = DataProcessor(args.csv_file, streaming=args.streaming, chunk_size=args.chunk_size,
+                              cache=args.cache and not args.streaming,
+                              summarise_by=('ProductCategory',) if args.streaming and args.categories else ())
+    timer.start("summarise")
+    report = build_report(processor, args.categories)
+    timer.start("write")
+    written = write_report(report, args.csv_file, args.output, args.format)
+    if args.charts:
+        timer.start("charts")
+        written += render_charts(processor, args.charts)
+    timer.stop()
+
+    print(f"total: {sum(timer.timings.values()):.3f} s, {processor.get_total_transactions()} transactions, "
+          f"{len(written)} file(s) written")
+    return timer.timings
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,355 @@
+import csv
+import json
+import os
+import sqlite3
+from array import array
+from datetime import date
+
+from data_processor import (CATEGORY_COLUMNS, DATE_COLUMNS, DEFAULT_CHUNK_SIZE, DEFAULT_RESULT_CACHE_SIZE,
+                            FLOAT_COLUMNS, INT_COLUMNS, PRIMARY_KEY, SUMMARY_COUNTED, SUMMARY_NUMERIC, ColumnStore,
+                            DataProcessor, GroupAggregate, check_cancelled, fingerprint, format_summary, instrumented,
+                            memoized, read_chunks)
+
+# Columns that get an index in the database, when the csv file has them
+INDEXED_COLUMNS = (PRIMARY_KEY, 'StoreLocation', 'ProductCategory', 'TransactionDate')
+
+TABLE = 'transactions'
+# Layout version of the database, bump it whenever the table changes so older databases are loaded again
+SCHEMA_VERSION = 2
+
+
+def quote(name):
+    # Column names come from the csv header, so they are quoted as SQL identifiers
+    return '"' + name.replace('"', '""') + '"'
+
+
+def column_type(name):
+    if name in FLOAT_COLUMNS:
+        return 'REAL'
+    if name in INT_COLUMNS:
+        return 'INTEGER'
+    return 'TEXT'
+
+
+def text_column(name):
+    # Column holding the text a typed value was loaded from, only filled when the typed value can't rebuild it
+    return name + ':text'
+
+
+def typed_columns(fieldnames):
+    return [name for name in fieldnames if name in FLOAT_COLUMNS or name in INT_COLUMNS or name in DATE_COLUMNS]
+
+
+def database_path_for(file_path):
+    """
+    :param file_path: path to the csv file
+    :return: path of the SQLite database kept next to it
+    """
+    return file_path + '.sqlite'
+
+
+# Process data from csv file, keeping the rows in a SQLite database instead of in memory
+class SQLiteDataProcessor(DataProcessor):
+
+    def __init__(self, file_path, db_path=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                 result_cache_size=DEFAULT_RESULT_CACHE_SIZE, instrument=False):
+        """
+        Loads the csv file into a SQLite database, or opens the database as it is if it was loaded from
+        the same version of the file before. The database can also be opened without the csv file.
+
+        :param file_path: path to the csv file we are working with
+        :param db_path: path of the database file, by default it is written next to the csv file
+        :param chunk_size: number of rows inserted, or read back, at a time
+        :param result_cache_size: number of aggregate results kept in memory between calls
+        :param instrument: if True, record call counts, latencies and rows scanned per method, see stats
+        """
+        self.db_path = database_path_for(file_path) if db_path is None else db_path
+        # Autocommit mode, so that every load runs in exactly the transaction started below.
+        # The dashboard queries from its worker thread, one query at a time
+        self.connection = sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False)
+        self.fieldnames = []
+        self.loaded = False  # True if the last load_data inserted the rows, False if the database was reused
+        super().__init__(file_path, chunk_size=chunk_size, result_cache_size=result_cache_size,
+                         instrument=instrument)
+        # The rows live in the database, so the methods without SQL read them back chunk by chunk,
+        # the same way streaming mode reads the csv file
+        self.streaming = True
+
+    def close(self):
+        self.connection.close()
+
+# Load the data from csv file into the database
+    @instrumented
+    def load_data(self, file_path):
+        """
+        Bulk-loads the csv file into the database in one transaction and indexes it.
+        Nothing is loaded if the database already holds this version of the file.
+
+        :param file_path: Path to the CSV file.
+        :return: None
+        """
+        self.data_version += 1
+        self.totals = None
+        self.cube = None
+        stored = self._meta()
+        key = fingerprint(file_path) if os.path.exists(file_path) else None
+        if stored is not None and (key is None or stored['fingerprint'] == key):
+            self.fieldnames = stored['fieldnames']
+            self.loaded = False
+            return
+
+        self.connection.execute('BEGIN')
+        try:
+            self.connection.execute(f'DROP TABLE IF EXISTS {TABLE}')
+            self.connection.execute('DROP TABLE IF EXISTS meta')
+            fieldnames = None
+            for chunk in read_chunks(file_path, self.chunk_size):
+                if fieldnames is None:
+                    fieldnames = chunk.fieldnames
+                    self._create_table(fieldnames)
+                self.connection.executemany(self._insert_sql(fieldnames), zip(*self._sql_columns(chunk)))
+                self._scanned(len(chunk))
+            if fieldnames is None:
+                with open(file_path, mode='r', encoding='utf-8') as file:
+                    fieldnames = next(csv.reader(file), [])
+                self._create_table(fieldnames)
+            # Indexes are built once after the insert, which is faster than updating them row by row
+            for name in INDEXED_COLUMNS:
+                if name in fieldnames:
+                    self.connection.execute(f'CREATE INDEX {quote("index_" + name)} ON {TABLE} ({quote(name)})')
+            self.connection.execute('CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)')
+            self.connection.executemany('INSERT INTO meta VALUES (?, ?)',
+                                        [('fingerprint', json.dumps(key)), ('fieldnames', json.dumps(fieldnames)),
+                                         ('schema', json.dumps(SCHEMA_VERSION))])
+            self.connection.execute('COMMIT')
+        except BaseException:
+            self.connection.execute('ROLLBACK')
+            raise
+        self.fieldnames = list(fieldnames)
+        self.loaded = True
+
+    def _meta(self):
+        """
+        :return: dictionary with the fingerprint and fieldnames of the loaded file, or None if nothing is loaded
+        """
+        try:
+            stored = dict(self.connection.execute('SELECT key, value FROM meta'))
+        except sqlite3.OperationalError:
+            return None
+        if 'fingerprint' not in stored or 'fieldnames' not in stored:
+            return None
+        if json.loads(stored.get('schema', '1')) != SCHEMA_VERSION:
+            return None
+        return {name: json.loads(value) for name, value in stored.items()}
+
+    def _create_table(self, fieldnames):
+        columns = [f'{quote(name)} {column_type(name)}' for name in fieldnames]
+        columns += [f'{quote(text_column(name))} TEXT' for name in typed_columns(fieldnames)]
+        self.connection.execute(f'CREATE TABLE {TABLE} ({", ".join(columns)})')
+
+    def _insert_sql(self, fieldnames):
+        names = list(fieldnames) + [text_column(name) for name in typed_columns(fieldnames)]
+        return (f'INSERT INTO {TABLE} ({", ".join(quote(name) for name in names)}) '
+                f'VALUES ({", ".join("?" * len(names))})')
+
+    def _sql_columns(self, store):
+        """
+        Turns the typed columns of a chunk into SQL values: numbers, ISO dates and text, NULL where invalid.
+        The typed columns are followed by their text columns, which keep the values that can't be rebuilt.
+
+        :param store: ColumnStore chunk
+        :return: list of value lists, one per column
+        """
+        columns = []
+        for name in store.fieldnames:
+            column = store.columns[name]
+            if name in store.nulls:
+                mask = store.nulls[name]
+                columns.append([None if null else value for value, null in zip(column, mask)])
+            elif name in DATE_COLUMNS:
+                columns.append([date.fromordinal(ordinal).isoformat() if ordinal else None for ordinal in column])
+            elif name in CATEGORY_COLUMNS:
+                categories = store.categories[name]
+                columns.append([categories[code] for code in column])
+            else:
+                columns.append(list(column))
+        for name in typed_columns(store.fieldnames):
+            texts = [None] * len(store)
+            positions, originals = store.raw[name]
+            for position, text in zip(positions, originals):
+                texts[position] = text
+            columns.append(texts)
+        return columns
+
+    def _row(self, values):
+        """
+        Builds the csv-style dictionary of one database row, formatted like the in-memory backend.
+
+        :param values: tuple of values in the order of self.fieldnames, followed by the text columns
+        :return: dictionary of column name -> string value
+        """
+        row = {}
+        texts = dict(zip(typed_columns(self.fieldnames), values[len(self.fieldnames):]))
+        for name, value in zip(self.fieldnames, values):
+            if texts.get(name) is not None:
+                row[name] = texts[name]
+            elif value is None:
+                row[name] = ''
+            elif name in FLOAT_COLUMNS:
+                row[name] = FLOAT_COLUMNS[name].format(value)
+            else:
+                row[name] = str(value)
+        return row
+
+    def _select(self, where='', parameters=(), limit=None):
+        names = self.fieldnames + [text_column(name) for name in typed_columns(self.fieldnames)]
+        columns = ', '.join(quote(name) for name in names)
+        sql = f'SELECT {columns} FROM {TABLE} {where} ORDER BY rowid' + (f' LIMIT {limit}' if limit else '')
+        return self.connection.execute(sql, parameters)
+
+    def _stores(self):
+        """
+        Reads the rows back from the database as ColumnStore chunks, for the methods that aren't done in SQL.
+
+        :return: generator of ColumnStore chunks
+        """
+        cursor = self._select()
+        while True:
+            rows = cursor.fetchmany(self.chunk_size)
+            if not rows:
+                break
+            check_cancelled(self.cancel_requested)
+            chunk = ColumnStore(self.fieldnames)
+            chunk.extend([self._row(values) for values in rows])
+            yield chunk
+
+    def append_rows(self, rows):
+        raise ValueError("Rows can't be appended to the SQLite database, load the changed csv file instead")
+
+# Counts the total amount of transactions
+    @instrumented
+    def get_total_transactions(self):
+        return self.connection.execute(f'SELECT COUNT(*) FROM {TABLE}').fetchone()[0]
+
+    def _distinct(self, name):
+        # Distinct values in order of first appearance, like the in-memory categories
+        if name not in self.fieldnames:
+            return []
+        sql = f'SELECT {quote(name)} FROM {TABLE} GROUP BY {quote(name)} ORDER BY MIN(rowid)'
+        return ['' if value is None else str(value) for value, in self.connection.execute(sql)]
+
+# Showing the list of possible locations and possible product categories
+    @instrumented
+    def get_unique_locations_and_categories(self):
+        return self._distinct('StoreLocation'), self._distinct('ProductCategory')
+
+# Read the parsed values of a numeric column
+    @instrumented
+    def get_column_values(self, name):
+        values = array('q' if name in INT_COLUMNS else 'd')
+        if name in self.fieldnames and (name in FLOAT_COLUMNS or name in INT_COLUMNS):
+            sql = f'SELECT {quote(name)} FROM {TABLE} WHERE {quote(name)} IS NOT NULL ORDER BY rowid'
+            values.extend(value for value, in self.connection.execute(sql))
+        return values
+
+    def _rows_equal(self, name, value, limit=None):
+        if name not in self.fieldnames:
+            return []
+        return [self._row(values) for values in self._select(f'WHERE {quote(name)} = ?', (value,), limit)]
+
+# Retrieve details of a specific transaction using the TransactionID
+    @instrumented
+    def get_transaction_details(self, transaction_id):
+        """
+        Show details of a specific transaction by ID, looked up through the TransactionID index.
+
+        :param transaction_id: the ID of transaction to show the information about
+        :return: details about specified transaction, or None if not found
+        """
+        rows = self._rows_equal(PRIMARY_KEY, transaction_id, limit=1)
+        return rows[0] if rows else None
+
+# Retrieve all transactions for a specific store location
+    @instrumented
+    def get_transactions_by_location(self, location):
+        """Retrieves all transactions for a specific store location, through the StoreLocation index."""
+        return self._rows_equal('StoreLocation', location)
+
+    @instrumented
+    def get_transactions_by_category(self, category):
+        """Retrieves all transactions for a specific product category, through the ProductCategory index."""
+        result = self._rows_equal('ProductCategory', category)
+        if not result:
+            print(f"No transactions found for category: {category}")
+        return result
+
+    def _location_aggregates(self, location=None):
+        """
+        Computes the summary aggregates per store location in SQL and returns them in the same form
+        as the in-memory backend, so that the summaries are formatted by the same code.
+
+        :param location: only compute this store location, or None for all of them
+        :return: dictionary of store location -> GroupAggregate, in order of first appearance
+        """
+        if 'StoreLocation' not in self.fieldnames:
+            return {}
+        numeric = [name for name in SUMMARY_NUMERIC if name in self.fieldnames]
+        counted = [name for name in SUMMARY_COUNTED if name in self.fieldnames]
+        where, parameters = ('WHERE "StoreLocation" = ?', (location,)) if location is not None else ('', ())
+        figures = ''.join(f', SUM({quote(name)}), COUNT({quote(name)}), MIN({quote(name)}), MAX({quote(name)})'
+                          for name in numeric)
+        groups = {}
+        for values in self.connection.execute(f'SELECT "StoreLocation", COUNT(*){figures} FROM {TABLE} {where} '
+                                              f'GROUP BY "StoreLocation" ORDER BY MIN(rowid)', parameters):
+            group = GroupAggregate(numeric, counted)
+            group.count = values[1]
+            for i in range(len(numeric)):
+                total, valid, lowest, highest = values[2 + 4 * i:6 + 4 * i]
+                group.sums[i] = total or 0
+                group.valid[i] = valid
+                group.mins[i] = lowest
+                group.maxs[i] = highest
+            groups['' if values[0] is None else values[0]] = group
+        for i, name in enumerate(counted):
+            sql = (f'SELECT "StoreLocation", {quote(name)}, COUNT(*) FROM {TABLE} {where} '
+                   f'GROUP BY "StoreLocation", {quote(name)} ORDER BY MIN(rowid)')
+            for group_location, value, count in self.connection.execute(sql, parameters):
+                groups['' if group_location is None else group_location].value_counts[i][value or ''] = count
+        self._scanned(sum(group.count for group in groups.values()))
+        return groups
+
+    @instrumented
+    @memoized
+    def group_by_location(self):
+        """
+        Calculates the total revenue of each store location with one GROUP BY query.
+
+        :return: a dictionary with store locations as keys and total revenue as values.
+        """
+        self.revenue_by_location = {}
+        if 'TotalPrice' in self.fieldnames:
+            self.revenue_by_location = {location: round(group.sum('TotalPrice'), 2)
+                                        for location, group in self._location_aggregates().items()}
+        return self.revenue_by_location
+
+#  Provide a summary of sales for a specific store location
+    @instrumented
+    @memoized
+    def sales_summary(self, location):
+        """
+        Generates a sales summary for a specific store location from SQL aggregates over its rows.
+
+        :param location: the store location to summarise
+        :return: sales summary, as returned by the in-memory backend, or None if the location has no transactions
+        """
+        group = self._location_aggregates(location).get(location)
+        if group is None:
+            print(f"No transactions found for location: {location}")
+            return None
+        return format_summary(group)
+
+#  Provide sales summaries for every store location at once
+    @instrumented
+    @memoized
+    def sales_summaries(self):
+        return {location: format_summary(group) for location, group in self._location_aggregates().items()}
@@ -1,5 +1,5 @@
 import pytest
-from data_processor_my import DataProcessor
+from data_processor import DataProcessor
 
 @pytest.fixture
 def processor():
@@ -68,11 +68,350 @@ def test_sales_summary(processor):
     # Verify that the total number of transactions for Store A is 2
     assert summary['Total Transactions'] == 2, "Error: Total transactions for Store A should be 2"
     # Verify that the total revenue for Store A is 25.00
-    assert summary['Total Revenue'] == 25.00, "Error: Total revenue for Store A should be $25.00"
+    assert summary['Total Revenue'] == '25.00', "Error: Total revenue for Store A should be $25.00"
     # Verify that the average customer satisfaction for Store A is 4.0
-    assert summary['Average Customer Satisfaction'] == 4.0, "Error: Average customer satisfaction should be 4.0"
+    assert summary['Average Customer Satisfaction'] == '4.00', "Error: Average customer satisfaction should be 4.00"
 
 
+def test_columns_are_typed(processor):
+    # Numeric columns should be parsed once at load time
+    assert processor.store.columns['TotalPrice'][1] == 20.00, "Error: TotalPrice should be stored as a float"
+    assert processor.store.columns['Quantity'][4] == 3, "Error: Quantity should be stored as an int"
+    # Store locations should be dictionary encoded
+    assert sorted(processor.store.categories['StoreLocation']) == ["Store A", "Store B", "Store C"], \
+        "Error: StoreLocation dictionary mismatch"
 
 
+def test_data_rows_are_built_on_access(processor):
+    # Rows should still look like csv.DictReader rows
+    assert processor.data[1]['PaymentMethod'] == 'Cash', "Error: Row 2 should be paid in cash"
+    # Verify that iterating the data gives every row
+    assert len(list(processor.data)) == 5, "Error: Data should contain 5 rows"
 
+
+def test_indexes_follow_appended_rows(processor):
+    # Build the indexes with a first lookup
+    assert processor.get_transaction_details('5')['StoreLocation'] == 'Store B', "Error: Transaction 5 mismatch"
+    assert len(processor.get_transactions_by_location('Store C')) == 1, "Error: Store C should have 1 transaction"
+    # Append a row and verify that both indexes see it
+    processor.store.append({'TransactionID': '6', 'StoreLocation': 'Store C', 'ProductCategory': 'Category 1',
+                            'TotalPrice': '5.00', 'Quantity': '1', 'CustomerSatisfaction': '2',
+                            'PaymentMethod': 'Cash'})
+    assert processor.get_transaction_details('6')['StoreLocation'] == 'Store C', "Error: Transaction 6 not indexed"
+    assert len(processor.get_transactions_by_location('Store C')) == 2, "Error: Store C should have 2 transactions"
+
+
+def test_sales_summaries_match_single_location(processor):
+    # Summaries for every location are computed in one pass
+    summaries = processor.sales_summaries()
+    assert set(summaries) == {"Store A", "Store B", "Store C"}, "Error: Summaries should cover every location"
+    # Verify that they agree with the per-location summary
+    assert summaries['Store B'] == processor.sales_summary('Store B'), "Error: Store B summaries disagree"
+
+
+def test_aggregate_by_category(processor):
+    from data_processor import aggregate
+    # Group by any column and read several aggregates from one pass
+    groups = aggregate(processor.store, 'ProductCategory')
+    assert groups['Category 2'].sum('TotalPrice') == 50.00, "Error: Category 2 revenue should be 50.00"
+    assert groups['Category 2'].max('Quantity') == 3, "Error: Category 2 max quantity should be 3"
+    assert groups['Category 1'].counts('PaymentMethod') == {'Card': 2}, "Error: Category 1 payment counts mismatch"
+
+
+def test_streaming_mode_matches_loaded_data(processor):
+    # Stream the same file two rows at a time
+    streamed = DataProcessor('test_data.csv', streaming=True, chunk_size=2)
+    assert streamed.get_total_transactions() == 5, "Error: Streaming should count 5 transactions"
+    # Verify that the running totals give the same answers as the loaded data
+    assert streamed.group_by_location() == processor.group_by_location(), "Error: Revenue by location mismatch"
+    assert streamed.sales_summary('Store A') == processor.sales_summary('Store A'), "Error: Sales summary mismatch"
+    # Row lookups read the file again
+    assert streamed.get_transaction_details('4')['StoreLocation'] == 'Store C', "Error: Transaction 4 mismatch"
+    # The rows can be counted, indexed and iterated again, like the loaded data
+    assert len(streamed.data) == 5, "Error: Streamed data should contain 5 rows"
+    assert streamed.data[3] == processor.data[3], "Error: Streamed row 4 mismatch"
+    assert list(streamed.data) == list(processor.data), "Error: Streamed rows mismatch"
+
+
+def test_parallel_streaming_matches_serial(processor):
+    # Read the file in three shards with separate processes
+    parallel = DataProcessor('test_data.csv', streaming=True, workers=3)
+    # Verify that the merged totals match the serial results
+    assert parallel.get_total_transactions() == 5, "Error: Parallel streaming should count 5 transactions"
+    assert parallel.group_by_location() == processor.group_by_location(), "Error: Revenue by location mismatch"
+    assert parallel.sales_summaries() == processor.sales_summaries(), "Error: Sales summaries mismatch"
+    # Loaded data is parsed in one process, so asking for workers without streaming is an error
+    with pytest.raises(ValueError):
+        DataProcessor('test_data.csv', workers=3)
+
+
+def test_parallel_streaming_with_line_breaks_in_fields(tmp_path):
+    # Quoted fields spanning two lines must not be split between shards
+    path = tmp_path / 'notes.csv'
+    path.write_text("TransactionID,StoreLocation,Note,TotalPrice\n" +
+                    "".join(f'{i},Store {i % 3},"line1\nline2",{i}.50\n' for i in range(200)))
+    serial = DataProcessor(str(path), streaming=True)
+    parallel = DataProcessor(str(path), streaming=True, workers=4)
+    assert parallel.get_total_transactions() == 200, "Error: Parallel streaming should count 200 transactions"
+    assert parallel.group_by_location() == serial.group_by_location(), "Error: Revenue by location mismatch"
+
+def test_cache_is_reused_until_file_changes(processor, tmp_path):
+    # The first load parses the csv and writes the cache
+    DataProcessor('test_data.csv', cache=True, cache_dir=tmp_path)
+    assert len(list(tmp_path.iterdir())) == 1, "Error: A cache file should have been written"
+    # The second load maps the cached columns instead of parsing
+    cached = DataProcessor('test_data.csv', cache=True, cache_dir=tmp_path)
+    assert isinstance(cached.store.columns['TotalPrice'], memoryview), "Error: Columns should come from the cache"
+    assert cached.sales_summaries() == processor.sales_summaries(), "Error: Cached data should give the same results"
+    # Add a row to the csv file, the stale cache has to be ignored
+    with open('test_data.csv', 'a') as f:
+        f.write("6,Store C,Category 1,5.00,1,2,Cash\n")
+    reloaded = DataProcessor('test_data.csv', cache=True, cache_dir=tmp_path)
+    assert reloaded.get_total_transactions() == 6, "Error: A changed file should be parsed again"
+
+
+def test_cache_keeps_values_with_the_separator(tmp_path):
+    # A quoted value may contain the character that separates the text values in the cache
+    path = tmp_path / 'ids.csv'
+    path.write_text('TransactionID,StoreLocation\n1,Store A\n"2\x1fx",Store B\n3,Store C\n')
+    DataProcessor(str(path), cache=True, cache_dir=tmp_path)
+    cached = DataProcessor(str(path), cache=True, cache_dir=tmp_path)
+    assert list(cached.store.columns['TransactionID']) == ['1', '2\x1fx', '3'], "Error: Cached IDs mismatch"
+    assert cached.get_transaction_details('3')['StoreLocation'] == 'Store C', "Error: Transaction 3 mismatch"
+
+def test_aggregates_are_memoized(processor):
+    # The first call computes the result, the second one comes from the cache
+    first = processor.group_by_location()
+    second = processor.group_by_location()
+    assert first == second, "Error: Cached revenue should match the computed one"
+    info = processor.cache_info()
+    assert (info['hits'], info['misses']) == (1, 1), "Error: Expected one cache hit and one miss"
+    # Changing a returned dictionary must not change the cached result
+    second['Store A'] = 0
+    assert processor.group_by_location()['Store A'] == 25.00, "Error: Cached result was modified by the caller"
+
+
+def test_result_cache_is_invalidated_and_bounded(processor):
+    processor.results.maxsize = 2
+    processor.sales_summary('Store A')
+    processor.sales_summary('Store B')
+    processor.sales_summary('Store C')
+    # Only the two most recently used summaries are kept
+    assert processor.cache_info()['size'] == 2, "Error: Result cache should hold at most 2 results"
+    # Reloading the data makes the cached results stale
+    processor.load_data('test_data.csv')
+    processor.sales_summary('Store C')
+    assert processor.cache_info()['misses'] == 4, "Error: Summary should be recomputed after reloading"
+
+
+def test_append_rows_updates_aggregates(processor):
+    # Compute the totals once, then append a new transaction
+    processor.sales_summary('Store A')
+    added = processor.append_rows([{'TransactionID': '6', 'StoreLocation': 'Store A', 'ProductCategory': 'Category 4',
+                                    'TotalPrice': '5.00', 'Quantity': '2', 'CustomerSatisfaction': '2',
+                                    'PaymentMethod': 'Cash'}])
+    assert added == 1, "Error: One row should have been appended"
+    # Verify that the summary, revenue, unique values and indexes include the new row
+    summary = processor.sales_summary('Store A')
+    assert summary['Total Transactions'] == 3, "Error: Store A should now have 3 transactions"
+    assert summary['Total Quantity Sold'] == 4, "Error: Store A should now have sold 4 items"
+    assert processor.group_by_location()['Store A'] == 30.00, "Error: Revenue for Store A should be $30.00"
+    assert "Category 4" in processor.get_unique_locations_and_categories()[1], "Error: Category 4 should be listed"
+    assert processor.get_transaction_details('6')['TotalPrice'] == '5.00', "Error: Transaction 6 should be found"
+
+
+def test_append_rows_rejects_duplicate_ids(processor):
+    # Transaction 3 already exists, so the whole batch is rejected
+    with pytest.raises(ValueError):
+        processor.append_rows([{'TransactionID': '7', 'StoreLocation': 'Store A'},
+                               {'TransactionID': '3', 'StoreLocation': 'Store A'}])
+    assert processor.get_total_transactions() == 5, "Error: A rejected batch should not add any rows"
+
+
+def test_invalid_numbers_go_to_null_mask(tmp_path):
+    # Prices written with currency symbols and separators, and one that isn't a number
+    path = tmp_path / 'prices.csv'
+    path.write_text("TransactionID,StoreLocation,TotalPrice,CustomerSatisfaction\n"
+                    "1,Store A,\"£1,000.50\",4\n2,Store A,\"10,50\",n/a\n3,Store A,unknown,2\n")
+    processor = DataProcessor(str(path))
+    assert list(processor.get_column_values('TotalPrice')) == [1000.50, 10.50], "Error: Prices parsed incorrectly"
+    assert processor.store.null_counts['TotalPrice'] == 1, "Error: One price should be marked as invalid"
+    # Invalid values are left out of the averages instead of counting as 0
+    summary = processor.sales_summary('Store A')
+    assert summary['Total Revenue'] == '1011.00', "Error: Total revenue should be 1011.00"
+    assert summary['Average Customer Satisfaction'] == '3.00', "Error: Average satisfaction should be 3.00"
+
+
+def test_nan_and_inf_are_not_numbers(tmp_path):
+    # float() accepts these, but they are not valid prices
+    path = tmp_path / 'prices.csv'
+    path.write_text("TransactionID,StoreLocation,TotalPrice\n1,A,10.00\n2,A,NaN\n3,A,inf\n4,A,1_000\n")
+    processor = DataProcessor(str(path))
+    assert processor.store.null_counts['TotalPrice'] == 3, "Error: NaN, inf and 1_000 should be marked as invalid"
+    assert processor.group_by_location() == {'A': 10.00}, "Error: Invalid prices should be left out of the revenue"
+
+def test_date_range_rollups(tmp_path):
+    path = tmp_path / 'dated.csv'
+    path.write_text("TransactionID,StoreLocation,ProductCategory,TransactionDate,PaymentMethod,Quantity,TotalPrice\n"
+                    "1,Store A,Category 1,2023-03-01,Cash,1,10.00\n"
+                    "2,Store B,Category 1,2023-03-15,Card,2,20.00\n"
+                    "3,Store A,Category 2,2023-04-02,Card,1,30.00\n")
+    processor = DataProcessor(str(path))
+    # Revenue by location for March only
+    march = processor.date_range_summary('2023-03-01', '2023-03-31')
+    assert march['Store A']['Total Revenue'] == 10.00, "Error: Store A March revenue should be 10.00"
+    assert march['Store B']['Total Quantity Sold'] == 2, "Error: Store B March quantity should be 2"
+    # Monthly trend, then a new day arrives and the cube is updated in place
+    assert processor.revenue_trend('month') == {'2023-03': 30.00, '2023-04': 30.00}, "Error: Monthly trend mismatch"
+    processor.append_rows([{'TransactionID': '4', 'StoreLocation': 'Store B', 'TransactionDate': '2023-04-03',
+                            'TotalPrice': '5.00'}])
+    assert processor.revenue_trend('month')['2023-04'] == 35.00, "Error: April revenue should include the new row"
+
+
+def test_summaries_by_location_and_category(processor):
+    # Both sets of summaries come from one pass over the data
+    summaries = processor.summaries_by('StoreLocation', 'ProductCategory')
+    assert summaries['StoreLocation']['Store A']['Total Revenue'] == '25.00', "Error: Store A revenue mismatch"
+    assert summaries['ProductCategory']['Category 2']['Total Transactions'] == 2, "Error: Category 2 should have 2"
+
+
+def test_cancelled_query_leaves_no_partial_results(processor):
+    from data_processor import QueryCancelled
+    # A cancel request from another thread stops the next query at its first check
+    processor.cancel_requested.set()
+    with pytest.raises(QueryCancelled):
+        processor.group_by_location()
+    assert processor.totals is None, "Error: A cancelled query should not keep half-built running totals"
+    # Once the request is cleared the query runs normally
+    processor.cancel_requested.clear()
+    assert processor.group_by_location()['Store A'] == 25.00, "Error: Revenue for Store A should be $25.00"
+
+def test_batch_report_writes_all_summaries(processor, tmp_path):
+    import json
+    import report
+    output = tmp_path / 'report.json'
+    # Run the report without any prompts
+    timings = report.main(['test_data.csv', '--output', str(output), '--categories'])
+    assert set(timings) == {'load', 'summarise', 'write'}, "Error: Every stage should be timed"
+    exported = json.loads(output.read_text())
+    assert set(exported['locations']) == {"Store A", "Store B", "Store C"}, "Error: Report should cover every location"
+    assert exported['categories']['Category 1']['Total Quantity Sold'] == 2, "Error: Category 1 quantity mismatch"
+
+
+def test_streamed_report_reads_the_file_once(processor, tmp_path):
+    import json
+    import report
+    # The output folder doesn't exist yet, it is created before the data is loaded
+    output = tmp_path / 'reports' / 'report.json'
+    report.main(['test_data.csv', '--output', str(output), '--categories', '--streaming'])
+    exported = json.loads(output.read_text())
+    assert exported['categories']['Category 1']['Total Quantity Sold'] == 2, "Error: Category 1 quantity mismatch"
+    # Category totals collected while streaming answer summaries_by without another pass
+    streamed = DataProcessor('test_data.csv', streaming=True, summarise_by=('ProductCategory',), instrument=True)
+    summaries = streamed.summaries_by('StoreLocation', 'ProductCategory')
+    assert summaries['ProductCategory'] == processor.summaries_by('ProductCategory')['ProductCategory'], \
+        "Error: Streamed category summaries mismatch"
+    assert streamed.stats()['summaries_by']['rows_scanned'] == 0, "Error: The file should not be read again"
+
+def test_instrumentation_stats(tmp_path):
+    path = tmp_path / 'sales.csv'
+    path.write_text("TransactionID,StoreLocation,TotalPrice\n1,Store A,10.00\n2,Store B,20.00\n3,Store A,5.00\n")
+    # Without instrumentation nothing is recorded
+    assert DataProcessor(str(path)).stats() == {}, "Error: Stats should be empty when instrumentation is off"
+    processor = DataProcessor(str(path), instrument=True)
+    processor.sales_summary('Store A')
+    processor.sales_summary('Store A')
+    stats = processor.stats()
+    assert stats['load_data']['rows_scanned'] == 3, "Error: Loading should scan every row"
+    # The second call is answered from the result cache, so only the first one reads the rows
+    assert stats['sales_summary']['calls'] == 2, "Error: Both summary calls should be counted"
+    assert stats['sales_summary']['rows_scanned'] == 3, "Error: Only the first summary should scan the rows"
+    assert stats['_running_totals']['calls'] == 1, "Error: Running totals should be built once"
+    # The simple lookups are timed too, like in the SQLite backend
+    processor.get_total_transactions()
+    assert processor.stats()['get_total_transactions']['calls'] == 1, "Error: Total transactions should be timed"
+    # Profiling returns the result together with the report
+    result, report = processor.profile('group_by_location', memory=True)
+    assert result == {'Store A': 15.00, 'Store B': 20.00}, "Error: Profiled result mismatch"
+    assert 'Peak traced memory' in report, "Error: Profile report should include the memory peak"
+
+
+def test_query_filters_and_pages(tmp_path):
+    path = tmp_path / 'dated.csv'
+    path.write_text("TransactionID,StoreLocation,TransactionDate,PaymentMethod,TotalPrice\n"
+                    "1,Rural,2023-03-01,Cash,10.00\n2,Rural,2023-03-15,Card,20.00\n"
+                    "3,Rural,2023-04-02,Cash,30.00\n4,Suburban,2023-03-05,Cash,40.00\n5,Rural,2023-03-20,Cash,50.00\n")
+    processor = DataProcessor(str(path))
+    query = processor.query().where(StoreLocation="Rural", PaymentMethod="Cash")
+    # Equality on two indexed columns and a date range
+    march = query.between("TransactionDate", "2023-03-01", "2023-03-31").select("TransactionID", "TotalPrice")
+    assert list(march) == [{'TransactionID': '1', 'TotalPrice': '10.00'}, {'TransactionID': '5', 'TotalPrice': '50.00'}], \
+        "Error: Rural cash transactions in March mismatch"
+    # Numeric ranges leave out rows that don't match, and pages split the result
+    assert query.between("TotalPrice", 20, 50).count() == 2, "Error: Two Rural cash transactions cost 20 to 50"
+    # Numbers are compared by value, not by how they are written
+    assert processor.query().where(TotalPrice='10.00').count() == 1, "Error: Transaction 1 costs 10.00"
+    assert processor.query().where(TotalPrice=10).count() == 1, "Error: Transaction 1 costs 10"
+    assert [len(page) for page in processor.query().pages(2)] == [2, 2, 1], "Error: Pages should hold 2, 2 and 1 rows"
+    assert processor.query().where(StoreLocation="Nowhere").first() is None, "Error: Unknown location should match nothing"
+    # Streaming mode gives the same rows
+    streamed = DataProcessor(str(path), streaming=True, chunk_size=2)
+    assert streamed.query().where(StoreLocation="Rural", PaymentMethod="Cash").count() == 3, \
+        "Error: Streaming query should find 3 Rural cash transactions"
+
+
+def test_customer_report_and_sketches(tmp_path):
+    from analytics import HyperLogLog, SpaceSaving, customer_report
+    path = tmp_path / 'customers.csv'
+    path.write_text("TransactionID,CustomerID,StoreLocation,ProductID,TotalPrice\n"
+                    "1,c1,Rural,p1,10.00\n2,c2,Rural,p2,30.00\n3,c1,Rural,p2,5.00\n4,c3,Suburban,p1,8.00\n")
+    # Exact counts on loaded data
+    report = customer_report(DataProcessor(str(path)), k=1)
+    assert report['Rural']['Distinct Customers'] == 2, "Error: Rural should have 2 distinct customers"
+    assert report['Rural']['Repeat Customer Rate'] == '50.00%', "Error: Half of the Rural customers came back"
+    assert report['Rural']['Top Products by Revenue'] == {'p2': 35.00}, "Error: p2 should be the top Rural product"
+    # Sketches of two halves merged give the same answer as one sketch of everything
+    halves = [HyperLogLog(), HyperLogLog()]
+    for number in range(5000):
+        halves[number % 2].add(f"customer {number}")
+    halves[0].merge(halves[1])
+    assert abs(halves[0].count() - 5000) < 5000 * 0.05, "Error: Distinct estimate should be within 5%"
+    heavy = SpaceSaving(capacity=10)
+    for number in range(1000):
+        heavy.add(f"product {number}", 1.0)
+        heavy.add("best seller", 2.0)
+    assert heavy.top(1)[0][0] == "best seller", "Error: The heavy hitter should be kept"
+
+
+def test_sqlite_backend_matches_memory(processor, tmp_path):
+    from sqlite_processor import SQLiteDataProcessor
+    database = str(tmp_path / 'test_data.sqlite')
+    stored = SQLiteDataProcessor('test_data.csv', db_path=database)
+    assert stored.loaded, "Error: The first start should load the csv file"
+    # The pushed-down queries give the same results as the in-memory backend
+    assert stored.get_transaction_details('3') == processor.get_transaction_details('3'), "Error: Details mismatch"
+    assert stored.get_transactions_by_location('Store B') == processor.get_transactions_by_location('Store B'), \
+        "Error: Transactions by location mismatch"
+    assert stored.group_by_location() == processor.group_by_location(), "Error: Revenue by location mismatch"
+    assert stored.sales_summary('Store A') == processor.sales_summary('Store A'), "Error: Sales summary mismatch"
+    stored.close()
+    # Opening the database again for the same file skips the load
+    reopened = SQLiteDataProcessor('test_data.csv', db_path=database)
+    assert not reopened.loaded, "Error: The database should be reused"
+    assert reopened.get_total_transactions() == 5, "Error: Reopened database should hold 5 transactions"
+
+
+def test_menu_starts_without_plotting_libraries(monkeypatch):
+    import subprocess
+    import sys
+    import visualizer
+    # Importing main must not load the plotting stack, it is only needed for options 8 and 9
+    result = subprocess.run([sys.executable, '-c', "import sys, main; "
+                             "print(any(name in sys.modules for name in ('matplotlib', 'numpy', 'tkinter')))"],
+                            capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == 'False', "Error: main.py should not import matplotlib, numpy or tkinter"
+    # Without a display the charts are drawn with Agg
+    monkeypatch.setattr(sys, 'platform', 'linux')
+    monkeypatch.delenv('DISPLAY', raising=False)
+    monkeypatch.delenv('WAYLAND_DISPLAY', raising=False)
+    assert visualizer.choose_backend() == 'Agg', "Error: Agg should be used when there is no display"
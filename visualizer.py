@@ -1,167 +1,420 @@
-import tkinter as tk
-from tkinter import messagebox
-import matplotlib.pyplot as plt
-import matplotlib
-matplotlib.use('TkAgg') # to see the animation on iOS
-from data_processor_my import DataProcessor
-from matplotlib.animation import FuncAnimation
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+try:
+    import tkinter as tk
+    from tkinter import messagebox, ttk
+except ImportError:  # Python built without Tk, the charts can still be saved as images
+    tk = messagebox = ttk = None
+from data_processor import DataProcessor, QueryCancelled
+
+# matplotlib and numpy are imported on first use, see load_pyplot, so importing this module stays fast
+
+# Backends that draw to files instead of windows
+FILE_BACKENDS = ('agg', 'cairo', 'pdf', 'pgf', 'ps', 'svg', 'template')
+
+
+def has_display():
+    """
+    Checks whether windows can be opened: Tk must be available and, on Linux and other X11 systems,
+    a DISPLAY or WAYLAND_DISPLAY must be set.
+
+    :return: True if there is a display to show windows on
+    """
+    if tk is None:
+        return False
+    if sys.platform in ('win32', 'darwin'):
+        return True
+    return bool(os.environ.get('DISPLAY') or os.environ.get('WAYLAND_DISPLAY'))
+
+
+def choose_backend():
+    """
+    :return: 'TkAgg' to see the animation in a window (also on macOS), or 'Agg' to draw to files when there is no display
+    """
+    return 'TkAgg' if has_display() else 'Agg'
+
+
+def load_pyplot(backend=None):
+    """
+    Imports matplotlib.pyplot the first time a chart is drawn. The backend is chosen with choose_backend,
+    unless one was set with the MPLBACKEND environment variable.
+
+    :param backend: backend to use instead, e.g. 'Agg' to only draw to files; it has no effect once pyplot is imported
+    :return: the matplotlib.pyplot module
+    """
+    if 'matplotlib.pyplot' not in sys.modules:
+        import matplotlib
+        if backend is not None:
+            matplotlib.use(backend)
+        elif not os.environ.get('MPLBACKEND'):
+            matplotlib.use(choose_backend())
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def shows_windows():
+    # True if the chosen backend opens windows, False if it only draws to files
+    return load_pyplot().get_backend().lower() not in FILE_BACKENDS
+
+
+def save_figure(fig, file_name):
+    """
+    Saves a figure as an image, used instead of a window when there is no display.
+
+    :param fig: the matplotlib figure
+    :param file_name: path of the image file
+    :return: None
+    """
+    write_figure(fig, file_name)
+    print(f"No display available, chart saved to {file_name}")
+
+
+def write_figure(fig, file_name):
+    # Saves a figure as an image and frees it, e.g. for the batch report
+    fig.savefig(file_name)
+    load_pyplot().close(fig)
+
+
+def pie_chart_figure(data, title):
+    """
+    Draws a pie chart, shared by the menu, the dashboard and the batch report.
+
+    :param data: dictionary of label -> value
+    :param title: title of the chart
+    :return: the matplotlib figure
+    """
+    fig, ax = load_pyplot().subplots(figsize=(8, 6))
+    ax.pie([float(value) for value in data.values()], labels=list(data.keys()), autopct='%1.1f%%')
+    ax.set_title(title)
+    return fig
+
+
+def histogram_figure(counts, edges, title):
+    """
+    Draws the histogram at its full height, as the last frame of the animation.
+
+    :param counts: number of values per bin, see histogram_bins
+    :param edges: bin edges, one more than there are counts
+    :param title: title of the plot
+    :return: the matplotlib figure
+    """
+    fig, update, frames = build_histogram_animation(counts, edges, title)
+    update(frames - 1)
+    return fig
+
 
 # Class for data visualisation
 class Visualizer:
     @staticmethod
     def pie_chart(data, title):
-        labels = data.keys()
-        sizes = [float(value) for value in data.values()]
-        plt.figure(figsize=(8, 6))
-        plt.pie(sizes, labels=labels, autopct='%1.1f%%')
-        plt.title(title)
-        plt.show()
+        fig = pie_chart_figure(data, title)
+        if shows_windows():
+            load_pyplot().show()
+        else:
+            save_figure(fig, "pie_chart.png")
 
     @staticmethod
     def histogram(data, title):
-        # Create a figure and axes for the plot
-        fig, ax = plt.subplots(figsize=(10, 6))
-
-        # Set the plot title
-        ax.set_title(title)
-        # Label the X-axis
-        ax.set_xlabel('Transaction Value')
-        # Label the Y-axis
-        ax.set_ylabel('Frequency')
-
-        # Create a histogram and get the bar heights
-        n, bins, patches = ax.hist(data, bins=30, edgecolor='black', alpha=0.7)
-        # Initialize bar heights to zero
-        heights = [0] * len(n)  # heights will store current heights of bars
-
-        # Define an update function for animation
-        def update(frame):
-            # Clear the previous histogram
-            ax.clear()
-            # Set plot title, labels, and adjust limits
-            ax.set_title(title)
-            ax.set_xlabel('Transaction Value')
-            ax.set_ylabel('Frequency')
-
-            # Gradually increase bar heights
-            for i in range(len(heights)):
-                # Increase height only if current height is less than target
-                if heights[i] < n[i]:
-                    heights[i] += n[i] / 30  # Gradually increasing the height
-                    # Make sure we don't exceed the target height
-                    if heights[i] > n[i]:
-                        heights[i] = n[i]
-
-            # Redraw the histogram with updated heights
-            ax.bar(bins[:-1], heights, width=[bins[i + 1] - bins[i] for i in range(len(bins) - 1)],
-                   edgecolor='black', alpha=0.7)
-
-            # Set limits on the X axis
-            ax.set_xlim(min(data), max(data))
-            # Set limits on the Y axis
-            ax.set_ylim(0, max(n) + 1)  # Increase the upper limit by a certain amount for better display
-
-        # Increase the number of frames for smoother animation
-        ani = FuncAnimation(fig, update, frames=30, interval= 200, repeat=False)
-        plt.show()  # Displaying the graph
+        # Count the values per bin once, the animation only changes the bar heights
+        counts, edges = histogram_bins(data)
+        Visualizer.binned_histogram(counts, edges, title)
+
+    @staticmethod
+    def binned_histogram(counts, edges, title):
+        if not shows_windows():
+            # Without a window there is nothing to animate, save the finished histogram instead
+            save_figure(histogram_figure(counts, edges, title), "histogram.png")
+            return
+
+        fig, update, frames = build_histogram_animation(counts, edges, title)
+        from matplotlib.animation import FuncAnimation
+        # Increase the number of frames for smoother animation, only the bars are redrawn in each frame
+        ani = FuncAnimation(fig, update, frames=frames, interval=200, repeat=False, blit=True)
+        load_pyplot().show()  # Displaying the graph
 
     @staticmethod
     def interactive_dashboard(processor):
+        if not has_display():
+            print("The interactive dashboard needs a display, use the charts or the batch report instead.")
+            return
         window = tk.Tk()
         create_window(window)
-        add_components(window, processor)
+        worker = DashboardWorker(window, processor)
+        add_components(window, processor, worker)
+        # Start computing the three location summaries as soon as the window is open
+        worker.submit("Preparing sales summaries", processor.sales_summaries)
+        window.protocol("WM_DELETE_WINDOW", lambda: close_window(window, worker))
         window.mainloop()
 
 
+# Number of bars in the histogram and number of animation frames used to grow them
+HISTOGRAM_BINS = 30
+HISTOGRAM_FRAMES = 30
+
+
+def histogram_bins(data, bins=HISTOGRAM_BINS):
+    """
+    Counts how many values fall in each bin with one vectorised pass over the data.
+
+    :param data: sequence of numbers, an array('d') from the processor is used without copying
+    :param bins: number of bins
+    :return: (counts per bin, bin edges)
+    """
+    import numpy as np
+    return np.histogram(np.asarray(data, dtype=float), bins=bins)
+
+
+def build_histogram_animation(counts, edges, title, frames=HISTOGRAM_FRAMES):
+    """
+    Draws the histogram bars once at zero height and returns the frame function that grows them.
+    Each frame only sets the heights of the existing bars, so its cost depends on the number of bins,
+    not on the number of values.
+
+    :param counts: number of values per bin
+    :param edges: bin edges, one more than there are counts
+    :param title: title of the plot
+    :param frames: number of frames until the bars reach their full height
+    :return: (figure, frame function returning the changed bars, number of frames)
+    """
+    import numpy as np
+    plt = load_pyplot()
+    # Create a figure and axes for the plot
+    fig, ax = plt.subplots(figsize=(10, 6))
+    # Set the plot title and label the axes
+    ax.set_title(title)
+    ax.set_xlabel('Transaction Value')
+    ax.set_ylabel('Frequency')
+
+    # Create the bars once, all starting at zero height
+    bars = ax.bar(edges[:-1], np.zeros(len(counts)), width=np.diff(edges), align='edge',
+                  edgecolor='black', alpha=0.7)
+    # The limits never change, so they are set once instead of in every frame
+    ax.set_xlim(edges[0], edges[-1])
+    ax.set_ylim(0, max(counts, default=0) + 1)  # Increase the upper limit by a certain amount for better display
+
+    # Define an update function for animation
+    def update(frame):
+        # Gradually increase bar heights until they reach their count in the last frame
+        share = (frame + 1) / frames
+        for bar, count in zip(bars, counts):
+            bar.set_height(count * share)
+        return bars
+
+    return fig, update, frames
+
+
+# How often the dashboard checks whether background work has finished, in milliseconds
+POLL_INTERVAL_MS = 100
+
+
+# Runs processor queries on a background thread so that the dashboard never freezes
+class DashboardWorker:
+    def __init__(self, window, processor):
+        self.window = window
+        self.processor = processor
+        # A single thread, so that two queries never use the processor at the same time
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.tasks = []  # [future, callback, description] for every query that hasn't been handled yet
+        self.stopping = []  # futures of cancelled queries that were already running and haven't stopped yet
+        self.polling = False
+
+        # Progress indicator and cancel button below the dashboard buttons
+        self.status = tk.StringVar(value="Ready")
+        tk.Label(window, textvariable=self.status, bg="#ddf", font=("Arial", 10)).grid(row=5, column=0, columnspan=2, sticky="W")
+        self.progress = ttk.Progressbar(window, mode='indeterminate')
+        self.progress.grid(row=6, column=0, sticky="EW", pady=(0, 10))
+        self.cancel_button = tk.Button(window, text="Cancel", bg="#ddf", font=("Arial", 10), state=tk.DISABLED,
+                                       command=self.cancel)
+        self.cancel_button.grid(row=6, column=1, padx=(10, 0), pady=(0, 10))
+
+    def submit(self, description, function, callback=None):
+        """
+        Runs a function on the background thread. The callback gets its result on the Tk main thread.
+
+        :param description: text shown next to the progress bar while the function runs
+        :param function: function without arguments that queries the processor
+        :param callback: function called with the result, or None to ignore it
+        :return: None
+        """
+        self.tasks.append([self.executor.submit(self.run, function), callback, description])
+        self.update_indicator()
+        self.start_polling()
+
+    def run(self, function):
+        # Runs on the background thread. Queries run one after the other, so a cancel request
+        # that is still set belongs to the query before this one
+        self.processor.cancel_requested.clear()
+        return function()
+
+    def start_polling(self):
+        if not self.polling:
+            self.polling = True
+            self.window.after(POLL_INTERVAL_MS, self.poll)
+
+    def poll(self):
+        # Hand finished results to their callbacks, then check again later while work is left
+        self.stopping = [future for future in self.stopping if not future.done()]
+        pending = []
+        for future, callback, description in self.tasks:
+            if not future.done():
+                pending.append([future, callback, description])
+            elif not future.cancelled() and not isinstance(future.exception(), QueryCancelled):
+                if future.exception() is not None:
+                    messagebox.showerror("Error", f"{description} failed: {future.exception()}")
+                elif callback is not None:
+                    callback(future.result())
+        self.tasks = pending
+        self.update_indicator()
+        if self.tasks or self.stopping:
+            self.window.after(POLL_INTERVAL_MS, self.poll)
+        else:
+            self.polling = False
+
+    def cancel(self):
+        """
+        Cancels every query. Waiting ones never start; the running one is asked to stop and does so
+        at its next check, between two chunks or batches of rows, raising QueryCancelled.
+
+        :return: None
+        """
+        for future, _, _ in self.tasks:
+            if not future.cancel():
+                self.stopping.append(future)
+        if self.stopping:
+            self.processor.cancel_requested.set()
+        self.tasks = []
+        self.update_indicator()
+        self.start_polling()
+
+    def update_indicator(self):
+        if self.tasks:
+            waiting = len(self.tasks) - 1
+            status = self.tasks[0][2] + "..." + (f" ({waiting} more waiting)" if waiting else "")
+            if self.stopping:
+                status += " after the cancelled query stops"
+            self.status.set(status)
+            self.progress.start(10)
+            self.cancel_button.config(state=tk.NORMAL)
+        elif self.stopping:
+            self.status.set("Cancelling...")
+            self.progress.start(10)
+            self.cancel_button.config(state=tk.DISABLED)
+        else:
+            self.status.set("Ready")
+            self.progress.stop()
+            self.cancel_button.config(state=tk.DISABLED)
+
+    def shutdown(self):
+        """
+        Stops the background work and waits until the running query has stopped, so that it no longer
+        changes the processor once the main menu uses it again.
+
+        :return: None
+        """
+        self.processor.cancel_requested.set()
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        self.processor.cancel_requested.clear()
+
+
 # Creating the main window for the interactive dashboard
 def create_window(window):
-    window.geometry("300x300")
+    window.geometry("340x400")
     window.title("Interactive Dashboard")
     window.config(bg="#ddf", padx=10, pady=10)
     return window
 
 
+# Closing the window, queries that are still waiting are dropped and the running one is stopped
+def close_window(window, worker):
+    worker.shutdown()
+    window.destroy()
+
+
 # Adding components (buttons)
-def add_components(window, processor):
-    add_button_pie_chart(window, processor)
-    add_button_hist(window, processor)
-    add_button_rural(window, processor)
-    add_button_suburban(window, processor)
-    add_button_city_centre(window, processor)
+def add_components(window, processor, worker):
+    add_button_pie_chart(window, processor, worker)
+    add_button_hist(window, processor, worker)
+    add_button_rural(window, processor, worker)
+    add_button_suburban(window, processor, worker)
+    add_button_city_centre(window, processor, worker)
 
 
 # Adding button for the pie chart
-def add_button_pie_chart(window, processor):
+def add_button_pie_chart(window, processor, worker):
     pie_button = tk.Button(window, text="Pie Chart Three Shops Income %", bg="#ddf", font=("Arial", 12), width=30, height=2)
     pie_button.grid(row=0, column=0, columnspan=2, sticky="EW", pady=(0, 10))
 
     # Configuring button to an event handler
-    pie_button.config(command=lambda: pie_button_clicked(processor))
+    pie_button.config(command=lambda: pie_button_clicked(processor, worker))
 
 
-def pie_button_clicked(processor):
-    location_revenue = processor.group_by_location()
-    Visualizer.pie_chart(location_revenue, "Revenue Contribution by Store Location")
+def pie_button_clicked(processor, worker):
+    worker.submit("Calculating revenue by location", processor.group_by_location,
+                  lambda location_revenue: Visualizer.pie_chart(location_revenue,
+                                                                "Revenue Contribution by Store Location"))
 
 
 # Adding button for the histogram
-def add_button_hist(window, processor):
+def add_button_hist(window, processor, worker):
     hist_button = tk.Button(window, text="Histogram", bg="#ddf", font=("Arial", 12), width=30, height=2)
     hist_button.grid(row=1, column=0, columnspan=2, sticky="EW", pady=(0, 10))
 
     # Configuring button to an event handler
-    hist_button.config(command=lambda: hist_button_clicked(processor))
+    hist_button.config(command=lambda: hist_button_clicked(processor, worker))
 
 
-def hist_button_clicked(processor):
-    transaction_values = [float(transaction['TotalPrice'].replace(',', '.')) for transaction in processor.data if 'TotalPrice' in transaction]
-    Visualizer.histogram(transaction_values, "Animated Histogram of Total Transaction Values")
+def hist_button_clicked(processor, worker):
+    # Counting the values per bin happens in the background, only the bars are drawn on the main thread
+    worker.submit("Counting transaction values", lambda: histogram_bins(processor.get_column_values('TotalPrice')),
+                  lambda bins: Visualizer.binned_histogram(bins[0], bins[1],
+                                                           "Animated Histogram of Total Transaction Values"))
 
 
 # Adding button for the sales summary for Rural area
-def add_button_rural(window, processor):
+def add_button_rural(window, processor, worker):
     rural_button = tk.Button(window, text="Sales Summary Rural Location", bg="#ddf", font=("Arial", 12), width=30, height=2)
     rural_button.grid(row=2, column=0, columnspan=2, sticky="EW", pady=(0, 10))
 
     # Configuring button to an event handler
-    rural_button.config(command=lambda: rural_button_clicked(processor))
+    rural_button.config(command=lambda: rural_button_clicked(processor, worker))
 
 
-def rural_button_clicked(processor):
-    summary = processor.sales_summary("Rural")
-    messagebox.showinfo("Sales Summary", summary)
+def rural_button_clicked(processor, worker):
+    worker.submit("Summarising Rural sales", lambda: processor.sales_summary("Rural"),
+                  lambda summary: messagebox.showinfo("Sales Summary", summary))
 
 
 # Adding button for the sales summary for Suburban area
-def add_button_suburban(window, processor):
+def add_button_suburban(window, processor, worker):
     suburban_button = tk.Button(window, text="Sales Summary Suburban Location", bg="#ddf", font=("Arial", 12), width=30, height=2)
     suburban_button.grid(row=3, column=0, columnspan=2, sticky="EW", pady=(0, 10))
 
     # Configuring button to an event handler
-    suburban_button.config(command=lambda: suburban_button_clicked(processor))
+    suburban_button.config(command=lambda: suburban_button_clicked(processor, worker))
 
 
-def suburban_button_clicked(processor):
-    summary = processor.sales_summary("Suburban")
-    messagebox.showinfo("Sales Summary", summary)
+def suburban_button_clicked(processor, worker):
+    worker.submit("Summarising Suburban sales", lambda: processor.sales_summary("Suburban"),
+                  lambda summary: messagebox.showinfo("Sales Summary", summary))
 
 
 # Adding button for the sales summary for City Centre area
-def add_button_city_centre(window, processor):
+def add_button_city_centre(window, processor, worker):
     city_centre_button = tk.Button(window, text="Sales Summary City Centre Location", bg="#ddf", font=("Arial", 12), width=30, height=2)
     city_centre_button.grid(row=4, column=0, columnspan=2, sticky="EW", pady=(0, 10))
 
     # Configuring button to an event handler
-    city_centre_button.config(command=lambda: city_centre_button_clicked(processor))
+    city_centre_button.config(command=lambda: city_centre_button_clicked(processor, worker))
 
 
-def city_centre_button_clicked(processor):
-    summary = processor.sales_summary("City Centre")
-    messagebox.showinfo("Sales Summary", summary)
+def city_centre_button_clicked(processor, worker):
+    worker.submit("Summarising City Centre sales", lambda: processor.sales_summary("City Centre"),
+                  lambda summary: messagebox.showinfo("Sales Summary", summary))
 
 
 def run():
-    processor = DataProcessor("retail_sales_data.csv")  # Initialize DataProcessor
+    processor = DataProcessor("retail_sales_data.csv", cache=True)  # Initialize DataProcessor, reusing the parsed cache
     Visualizer.interactive_dashboard(processor)
 
 